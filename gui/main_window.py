@@ -2,23 +2,24 @@ import tkinter as tk
 from tkinter import simpledialog, messagebox, scrolledtext
 import sys
 import os
+from typing import List, Optional
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from presenter.presenter import Presenter
+from model.timing import StartupReport
 
 class ChatWindow(tk.Tk):
     """
     The main GUI for the chat application.
     """
-    def __init__(self, presenter: Presenter, username: str = "GUI_User"):
+    def __init__(self, presenter: Presenter, username: str = "GUI_User",
+                 startup_report: Optional[StartupReport] = None):
         super().__init__()
         self.presenter = presenter
         self.username = username
-
-        if self.username not in self.presenter.get_participants():
-            self.presenter.add_participant(self.username)
+        self.startup_report = startup_report
 
         self.title(f"Local Chat - {self.presenter.chat_name} - Logged in as {self.username}")
         self.geometry("600x500")
@@ -26,7 +27,33 @@ class ChatWindow(tk.Tk):
         self._setup_widgets()
         self._create_menu()
 
-        self.after(100, self._update_chat_display)
+        if self.startup_report:
+            self.bind("<Map>", self._on_first_map)
+        # The chat is loaded once the window is up, so opening the window
+        # does not wait for the history to be read.
+        self.after(100, self._load_current_chat)
+
+    def _on_first_map(self, event):
+        # Child widgets report <Map> through the root's bindings too.
+        if event.widget is self:
+            self.unbind("<Map>")
+            self.startup_report.mark("window shown")
+
+    def _load_current_chat(self):
+        self._join_current_chat()
+        self._update_chat_display(force_update=True)
+        if self.startup_report:
+            self.startup_report.mark("chat loaded")
+            print(self.startup_report.format())
+            self.startup_report = None
+
+    def _join_current_chat(self):
+        """Makes sure the user can write in the current chat and refreshes the speakers."""
+        participants = self.presenter.get_participants()
+        if self.username not in participants:
+            self.presenter.add_participant(self.username)
+            participants = [*participants, self.username]
+        self._update_speaker_menu(participants)
 
     def _setup_widgets(self):
         main_frame = tk.Frame(self)
@@ -43,7 +70,6 @@ class ChatWindow(tk.Tk):
         self.speaker_var = tk.StringVar(self)
         self.speaker_menu = tk.OptionMenu(input_frame, self.speaker_var, None)
         self.speaker_menu.pack(side=tk.LEFT, padx=(0, 5))
-        self._update_speaker_menu()
 
         self.message_input = tk.Entry(input_frame, font=("Arial", 12))
         self.message_input.pack(side=tk.LEFT, fill=tk.X, expand=True, ipady=5)
@@ -54,8 +80,9 @@ class ChatWindow(tk.Tk):
         )
         self.send_button.pack(side=tk.RIGHT, padx=(5, 0))
 
-    def _update_speaker_menu(self):
-        participants = self.presenter.get_participants()
+    def _update_speaker_menu(self, participants: Optional[List[str]] = None):
+        if participants is None:
+            participants = self.presenter.get_participants()
         menu = self.speaker_menu["menu"]
         menu.delete(0, "end")
 
@@ -77,9 +104,9 @@ class ChatWindow(tk.Tk):
         chats_menu = tk.Menu(self.menubar, tearoff=0)
         self.menubar.add_cascade(label="Chats", menu=chats_menu)
         chats_menu.add_command(label="New Chat...", command=self._create_chat)
-        self.chats_list_menu = tk.Menu(chats_menu, tearoff=0)
+        # The chat list is read when the menu is opened, not at startup.
+        self.chats_list_menu = tk.Menu(chats_menu, tearoff=0, postcommand=self._update_chat_list_menu)
         chats_menu.add_cascade(label="Switch Chat", menu=self.chats_list_menu)
-        self._update_chat_list_menu()
 
         participants_menu = tk.Menu(self.menubar, tearoff=0)
         self.menubar.add_cascade(label="Participants", menu=participants_menu)
@@ -113,7 +140,6 @@ class ChatWindow(tk.Tk):
             try:
                 self.presenter.create_chat(chat_name)
                 self.presenter.switch_chat(chat_name)
-                self._update_chat_list_menu()
                 self._update_title()
                 self._update_chat_display(force_update=True)
             except ValueError as e:
@@ -121,13 +147,8 @@ class ChatWindow(tk.Tk):
 
     def _switch_chat(self, chat_name):
         self.presenter.switch_chat(chat_name)
-
-        participants = self.presenter.get_participants()
-        if self.username not in participants:
-            self.presenter.add_participant(self.username)
-
+        self._join_current_chat()
         self._update_title()
-        self._update_speaker_menu()
         self._update_chat_display(force_update=True)
 
     def _update_chat_list_menu(self):
@@ -219,7 +240,11 @@ class ChatWindow(tk.Tk):
 
         if new_content is not None:
             if messagebox.askyesno("Confirm Edit", "Are you sure you want to edit this message?"):
-                self.presenter.edit_message(message_id, new_content)
+                try:
+                    # Only apply the edit if nobody changed the message meanwhile.
+                    self.presenter.edit_message(message_id, new_content, message.version)
+                except ValueError as e:
+                    messagebox.showerror("Error", str(e))
                 self._update_chat_display()
 
     def _delete_message(self):
@@ -228,12 +253,16 @@ class ChatWindow(tk.Tk):
             return
 
         # Verify message exists before asking for confirmation
-        if not self.presenter.get_message_by_id(message_id):
+        message = self.presenter.get_message_by_id(message_id)
+        if not message:
             messagebox.showerror("Error", f"Message with ID {message_id} not found.")
             return
 
         if messagebox.askyesno("Confirm Delete", "Are you sure you want to permanently delete this message?"):
-            self.presenter.delete_message(message_id)
+            try:
+                self.presenter.delete_message(message_id, message.version)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
             self._update_chat_display()
 
     def run(self):
@@ -1,4 +1,10 @@
+import time
+# Taken before the heavier imports so the startup report covers them.
+_STARTED = time.perf_counter()
+
+import argparse
 import sys
+from model.timing import StartupReport
 from presenter.presenter import Presenter
 from gui.main_window import ChatWindow
 
@@ -7,13 +13,25 @@ def main():
     Main entry point for the Local Chat application.
     This script launches the graphical user interface (GUI).
     """
+    parser = argparse.ArgumentParser(description="Launch the Local Chat GUI.")
+    parser.add_argument(
+        "--startup-report", action="store_true",
+        help="Print how long startup took until the window and the chat were ready."
+    )
+    args = parser.parse_args()
+    startup_report = StartupReport(_STARTED) if args.startup_report else None
+    if startup_report:
+        startup_report.mark("imports")
+
     print("Launching Local Chat GUI...")
 
     # The Presenter is the core of the application's logic
     presenter = Presenter()
+    if startup_report:
+        startup_report.mark("presenter created")
 
     # The ChatWindow is the GUI view, driven by the presenter
-    app = ChatWindow(presenter, username="User") # You can change the username here
+    app = ChatWindow(presenter, username="User", startup_report=startup_report) # You can change the username here
 
     # Start the GUI event loop
     app.run()
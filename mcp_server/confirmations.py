@@ -0,0 +1,58 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+
+class PendingConfirmation(NamedTuple):
+    """An edit or delete that is waiting for the client to confirm it."""
+    chat_name: str
+    action: str
+    message_id: int
+    version: int
+    new_content: Optional[str]
+    expires_at: float
+
+
+class ConfirmationCache:
+    """
+    Short-lived, single-use confirmation tokens for edits and deletes.
+    Each token is bound to the message version that was shown to the user,
+    so the confirmed action can be applied as a compare-and-set. At most
+    max_entries tokens are pending; beyond that the oldest are dropped.
+    """
+    def __init__(self, ttl: float = 300.0, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Tokens in issue order, so expired ones are always at the front.
+        self._pending: "OrderedDict[str, PendingConfirmation]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now: float):
+        while self._pending:
+            token, pending = next(iter(self._pending.items()))
+            if pending.expires_at > now:
+                break
+            del self._pending[token]
+
+    def issue(self, chat_name: str, action: str, message_id: int, version: int,
+              new_content: Optional[str] = None) -> str:
+        """Stores a pending action and returns the token that confirms it."""
+        token = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            self._pending[token] = PendingConfirmation(
+                chat_name, action, message_id, version, new_content, now + self.ttl
+            )
+            while len(self._pending) > self.max_entries:
+                self._pending.popitem(last=False)
+        return token
+
+    def redeem(self, token: str) -> Optional[PendingConfirmation]:
+        """Removes and returns the pending action, or None if unknown or expired."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            return self._pending.pop(token, None)
@@ -0,0 +1,150 @@
+import io
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from model import timing
+
+if TYPE_CHECKING:
+    # cProfile and pstats are only imported at runtime once profiling is used.
+    import cProfile
+    import pstats
+
+
+class RequestProfile:
+    """Per-request profiling state, created when a request starts."""
+
+    def __init__(self, profiler: Optional["cProfile.Profile"], record_phases: bool):
+        self.started = time.perf_counter()
+        self.profiler = profiler
+        self.record_phases = record_phases
+
+
+class RequestProfiler:
+    """
+    Opt-in request profiling for the MCP server.
+
+    A fraction of requests (sample_rate) is run under cProfile and the
+    results are aggregated into a single pstats report. Independently, any
+    request slower than slow_threshold_ms is added to a bounded slow-operation
+    log together with its per-phase timings. Both settings can be changed at
+    runtime; with the defaults, profiling is off and costs nothing.
+    """
+    def __init__(self, sample_rate: float = 0.0, slow_threshold_ms: Optional[float] = None,
+                 slow_log_size: int = 200):
+        self.sample_rate = sample_rate
+        self.slow_threshold_ms = slow_threshold_ms
+        self.slow_log = deque(maxlen=slow_log_size)
+        self.sampled_requests = 0
+        self._stats: Optional["pstats.Stats"] = None
+        self._lock = threading.Lock()
+
+    def configure(self, sample_rate: Optional[float] = None, slow_threshold_ms: Optional[float] = None,
+                  disable_slow_log: bool = False) -> None:
+        """Changes the profiling settings."""
+        if sample_rate is not None:
+            if not 0.0 <= sample_rate <= 1.0:
+                raise ValueError("'sample_rate' must be between 0 and 1.")
+            self.sample_rate = sample_rate
+        if disable_slow_log:
+            self.slow_threshold_ms = None
+        elif slow_threshold_ms is not None:
+            if slow_threshold_ms < 0:
+                raise ValueError("'slow_threshold_ms' must not be negative.")
+            self.slow_threshold_ms = slow_threshold_ms
+
+    def get_config(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "sampled_requests": self.sampled_requests,
+            "slow_log_entries": len(self.slow_log),
+        }
+
+    def begin(self) -> Optional[RequestProfile]:
+        """Starts profiling the current request, if it is selected."""
+        record_phases = self.slow_threshold_ms is not None
+        profiler = None
+        if self.sample_rate and random.random() < self.sample_rate:
+            # cProfile and pstats are only imported once sampling is on,
+            # to keep them off the server's startup path.
+            import cProfile
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another request on a different thread is being profiled.
+                profiler = None
+        if profiler is None and not record_phases:
+            return None
+        if record_phases:
+            timing.start_recording()
+        return RequestProfile(profiler, record_phases)
+
+    def end(self, profile: Optional[RequestProfile], route: str, chat: Optional[str],
+            history_size: Optional[dict], status: int) -> None:
+        """Finishes profiling the current request."""
+        if profile is None:
+            return
+        elapsed_ms = (time.perf_counter() - profile.started) * 1000
+        phases = timing.stop_recording() if profile.record_phases else None
+
+        if profile.profiler is not None:
+            import pstats
+            profile.profiler.disable()
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile.profiler)
+                else:
+                    self._stats.add(profile.profiler)
+                self.sampled_requests += 1
+
+        threshold = self.slow_threshold_ms
+        if threshold is not None and elapsed_ms >= threshold:
+            entry = {
+                "time": datetime.now().isoformat(),
+                "route": route,
+                "chat": chat,
+                "history": history_size,
+                "status": status,
+                "duration_ms": round(elapsed_ms, 3),
+                "phases_ms": {name: round(seconds * 1000, 3) for name, seconds in (phases or {}).items()},
+            }
+            with self._lock:
+                self.slow_log.append(entry)
+
+    def get_slow_log(self) -> List[dict]:
+        with self._lock:
+            return list(self.slow_log)
+
+    def format_stats(self, sort: str = "cumulative", limit: int = 40) -> str:
+        """Returns the aggregated cProfile report as text."""
+        with self._lock:
+            if self._stats is None:
+                return "No requests have been profiled yet.\n"
+            stream = io.StringIO()
+            self._stats.stream = stream
+            self._stats.sort_stats(sort).print_stats(limit)
+            return stream.getvalue()
+
+    def dump_stats(self, path: str) -> None:
+        """Writes the aggregated cProfile data to a file readable by pstats."""
+        with self._lock:
+            if self._stats is None:
+                raise ValueError("No requests have been profiled yet.")
+            self._stats.dump_stats(path)
+
+    def reset(self) -> None:
+        """Discards the aggregated profile and the slow-operation log."""
+        with self._lock:
+            self._stats = None
+            self.sampled_requests = 0
+            self.slow_log.clear()
@@ -1,29 +1,119 @@
+import time
+# Taken before the heavier imports so the startup report covers them.
+_STARTED = time.perf_counter()
+
+import argparse
 import sys
 import os
-from flask import Flask, jsonify, request
+from typing import Optional
+from flask import Flask, Response, g, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from presenter.presenter import Presenter
+from model.chat import StaleVersionError
 from model.message import Message # Needed for type hinting
+from mcp_server.confirmations import ConfirmationCache
+from mcp_server.profiling import RequestProfiler
+from model.timing import StartupReport, phase
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Records the time spent building JSON responses as the 'jsonify' phase."""
+    def response(self, *args, **kwargs):
+        with phase("jsonify"):
+            return super().response(*args, **kwargs)
 
 # Create the Flask app and the Presenter
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 # We create a single presenter instance that all requests will share.
 # This ensures that all interactions go through the same model instance.
 presenter = Presenter()
+# Pending edit/delete confirmations, bound to the message version shown.
+confirmations = ConfirmationCache()
+# Opt-in request profiling and slow-operation log, off by default.
+profiler = RequestProfiler()
+# Where POST /debug/profile/dump writes the aggregated cProfile data.
+profile_dump_path = "mcp_server.prof"
+# Set by --startup-report; printed after the first request is served.
+startup_report: Optional[StartupReport] = None
 
 # --- Helper Functions ---
 
-def format_message(message: Message) -> dict:
-    """Converts a Message object to a JSON-serializable dictionary."""
-    return {
+def format_message(message: Message, preview_chars: Optional[int] = None) -> dict:
+    """
+    Converts a Message object to a JSON-serializable dictionary. With
+    preview_chars, the content is truncated to that many characters and
+    out-of-line bodies are not loaded unless the preview needs them.
+    """
+    data = {
         "id": message.id,
         "name": message.name,
         "timestamp": message.timestamp.isoformat(),
-        "content": message.content
+        "version": message.version
     }
+    if preview_chars is None:
+        data["content"] = message.content
+    else:
+        data["content"] = message.get_preview(preview_chars)
+        # Out-of-line bodies are always longer than any stored preview.
+        data["truncated"] = message.blob_ref is not None or len(message.content) > preview_chars
+    if message.blob_ref is not None:
+        data["content_ref"] = message.blob_ref
+    return data
+
+def _history_size(chat_name: str) -> dict:
+    """Returns the size of a chat's history without loading it."""
+    history_file = presenter.chat_manager.get_chat_history_file(chat_name)
+    size = {"bytes": os.path.getsize(history_file) if os.path.exists(history_file) else 0}
+    # The in-process presenter may already hold the current chat in memory.
+    model = getattr(presenter, "loaded_model", None)
+    if model is not None and model.chat_name == chat_name:
+        size["messages"] = len(model.messages)
+    return size
+
+# --- Profiling Hooks ---
+
+@app.before_request
+def start_profiling():
+    g.profile = None if request.path.startswith("/debug/") else profiler.begin()
+
+@app.after_request
+def record_status(response):
+    g.status_code = response.status_code
+    return response
+
+@app.teardown_request
+def finish_profiling(exc):
+    # A teardown hook also runs when the view raised (after_request does not
+    # in debug mode), so cProfile and the phase recorder are always stopped.
+    # Requests that never produced a response are logged as 500.
+    profile = g.pop("profile", None)
+    if profile is not None:
+        chat_name = (request.view_args or {}).get("chat_name") or presenter.chat_name
+        profiler.end(
+            profile,
+            route=f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+            chat=chat_name,
+            history_size=_history_size(chat_name),
+            status=g.pop("status_code", 500)
+        )
+
+@app.before_request
+def mark_first_request():
+    if startup_report is not None:
+        startup_report.mark("first request received")
+
+@app.after_request
+def report_startup(response):
+    global startup_report
+    if startup_report is not None:
+        startup_report.mark("first request served")
+        print(startup_report.format())
+        startup_report = None
+    return response
 
 # --- API Endpoints ---
 
@@ -40,14 +130,85 @@ def list_chats():
 
 @app.route("/chats/<string:chat_name>", methods=["GET"])
 def view_chat(chat_name: str):
-    """Returns the entire chat history for a given chat."""
+    """
+    Returns the entire chat history for a given chat. Pass ?preview=N to get
+    message contents truncated to N characters.
+    """
+    preview_chars = request.args.get("preview", type=int)
+    if "preview" in request.args and (preview_chars is None or preview_chars < 0):
+        return jsonify({"error": "Query parameter 'preview' must be a non-negative integer"}), 400
     try:
         presenter.switch_chat(chat_name)
-        messages = presenter.get_messages()
-        return jsonify([format_message(msg) for msg in messages]), 200
+        messages = presenter.get_messages(chat_name=chat_name)
+        return jsonify([format_message(msg, preview_chars) for msg in messages]), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 404
 
+# Largest number of chats accepted by a single batch read.
+MAX_BATCH_CHATS = 100
+
+@app.route("/chats/batch", methods=["POST"])
+def read_chats():
+    """
+    Reads several chats in one request. The body is
+    {"chats": [{"name": ..., "since_seq": N | "limit": N, "preview": N}, ...]}.
+    """
+    data = request.get_json()
+    if not isinstance(data, dict) or not isinstance(data.get("chats"), list):
+        return jsonify({"error": "Request body must contain a 'chats' list"}), 400
+    chat_requests = data["chats"]
+    if len(chat_requests) > MAX_BATCH_CHATS:
+        return jsonify({"error": f"At most {MAX_BATCH_CHATS} chats can be read at once"}), 400
+    for chat_request in chat_requests:
+        if not isinstance(chat_request, dict) or not isinstance(chat_request.get("name"), str):
+            return jsonify({"error": "Each entry in 'chats' must be an object with a 'name'"}), 400
+        for key in ("since_seq", "limit", "preview"):
+            value = chat_request.get(key)
+            # bool is a subclass of int, but true/false are not valid counts.
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+                return jsonify({"error": f"'{key}' must be a non-negative integer"}), 400
+        if chat_request.get("since_seq") is not None and chat_request.get("limit") is not None:
+            return jsonify({"error": "An entry can have 'since_seq' or 'limit', not both"}), 400
+
+    results = presenter.read_chats(chat_requests)
+    for chat_request, result in zip(chat_requests, results):
+        if "messages" in result:
+            result["messages"] = [format_message(msg, chat_request.get("preview")) for msg in result["messages"]]
+    return jsonify(results), 200
+
+@app.route("/chats/<string:chat_name>/context", methods=["GET"])
+def view_context(chat_name: str):
+    """Returns the most recent messages that fit within ?max_tokens=N."""
+    max_tokens = request.args.get("max_tokens", type=int)
+    if max_tokens is None or max_tokens < 0:
+        return jsonify({"error": "Query parameter 'max_tokens' must be a non-negative integer"}), 400
+
+    try:
+        messages = presenter.get_context(chat_name, max_tokens)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({
+        "tokens": sum(msg.tokens for msg in messages),
+        "messages": [format_message(msg) for msg in messages]
+    }), 200
+
+@app.route("/chats/<string:chat_name>/blobs/<string:digest>", methods=["GET"])
+def view_blob(chat_name: str, digest: str):
+    """Returns an out-of-line message body by its content reference."""
+    try:
+        return jsonify({"content_ref": digest, "content": presenter.get_blob(chat_name, digest)}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+
+@app.route("/chats/<string:chat_name>/changes", methods=["GET"])
+def view_changes(chat_name: str):
+    """Returns the changes made to a chat after the given sequence number."""
+    since_seq = request.args.get("since_seq", 0, type=int)
+    try:
+        return jsonify(presenter.get_changes(chat_name, since_seq)), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+
 @app.route("/chats", methods=["POST"])
 def create_chat():
     """Creates a new chat and returns its details."""
@@ -69,7 +230,7 @@ def create_chat():
 @app.route("/participants", methods=["GET"])
 def view_participants():
     """Returns the current list of participants."""
-    participants = presenter.get_participants()
+    participants = presenter.get_participants(chat_name=presenter.chat_name)
     return jsonify(participants), 200
 
 @app.route("/participants", methods=["POST"])
@@ -80,7 +241,7 @@ def add_participant():
         return jsonify({"error": "Missing 'name' in request body"}), 400
 
     name = data["name"]
-    presenter.add_participant(name)
+    presenter.add_participant(name, chat_name=presenter.chat_name)
     return jsonify({"message": f"Participant '{name}' added successfully."}), 201
 
 @app.route("/participants", methods=["DELETE"])
@@ -91,12 +252,13 @@ def remove_participant():
         return jsonify({"error": "Missing 'name' in request body"}), 400
 
     name = data["name"]
+    chat_name = presenter.chat_name
     # The current model doesn't error on removing a non-existent user,
     # but we can add a check here for a more robust API.
-    if name not in presenter.get_participants():
+    if name not in presenter.get_participants(chat_name=chat_name):
         return jsonify({"error": f"Participant '{name}' not found."}), 404
 
-    presenter.remove_participant(name)
+    presenter.remove_participant(name, chat_name=chat_name)
     return jsonify({"message": f"Participant '{name}' removed successfully."}), 200
 
 @app.route("/messages", methods=["POST"])
@@ -110,7 +272,7 @@ def add_message():
     content = data["message"]
 
     try:
-        new_message = presenter.add_message(name, content)
+        new_message = presenter.add_message(name, content, chat_name=presenter.chat_name)
         return jsonify(format_message(new_message)), 201
     except ValueError as e:
         # This happens if the participant is not approved
@@ -128,12 +290,30 @@ def insert_message():
     after_id = data["after_id"]
 
     try:
-        new_message = presenter.insert_message(name, content, after_id)
+        new_message = presenter.insert_message(name, content, after_id, chat_name=presenter.chat_name)
         return jsonify(format_message(new_message)), 201
     except ValueError as e:
         # This happens if the participant is not approved or the after_id is not found
         return jsonify({"error": str(e)}), 400
 
+def _redeem_confirmation(chat_name: str, action: str, message_id: int, new_content=None):
+    """
+    Validates the confirmation token of a confirmed request.
+    Returns the pending confirmation, or an error response tuple.
+    """
+    token = request.args.get('token')
+    if not token:
+        return None, (jsonify({"error": "Missing 'token'. Request confirmation first."}), 400)
+
+    pending = confirmations.redeem(token)
+    if pending is None:
+        return None, (jsonify({"error": "Confirmation token is invalid or has expired."}), 400)
+    if (pending.action, pending.message_id, pending.new_content) != (action, message_id, new_content):
+        return None, (jsonify({"error": "Confirmation token does not match this request."}), 400)
+    if pending.chat_name != chat_name:
+        return None, (jsonify({"error": f"Confirmation token belongs to chat '{pending.chat_name}'."}), 409)
+    return pending, None
+
 @app.route("/messages/<int:message_id>", methods=["PUT"])
 def edit_message(message_id: int):
     """Edits a specified message, requiring confirmation."""
@@ -145,28 +325,42 @@ def edit_message(message_id: int):
 
     # Check for confirmation
     is_confirmed = request.args.get('confirm') == 'true'
+    # Read the current chat once, so a concurrent switch cannot split this request.
+    chat_name = presenter.chat_name
 
     try:
-        message = presenter.get_message_by_id(message_id)
-        if not message:
-            raise ValueError(f"Message with ID {message_id} not found.")
-
         if not is_confirmed:
             # Step 1: Request confirmation from the client
+            message = presenter.get_message_by_id(message_id, chat_name=chat_name)
+            if not message:
+                raise ValueError(f"Message with ID {message_id} not found.")
+
+            token = confirmations.issue(
+                chat_name, "edit", message.id, message.version, new_content
+            )
             return jsonify({
                 "confirmation_required": True,
                 "message": "Please confirm that you want to edit this message.",
+                "confirmation_token": token,
+                "expires_in": confirmations.ttl,
                 "details": {
                     "id": message.id,
+                    "version": message.version,
                     "current_content": message.content,
                     "new_content": new_content
                 }
             }), 200 # 200 OK, but with a special body for the tool to interpret
         else:
-            # Step 2: Perform the action
-            presenter.edit_message(message_id, new_content)
+            # Step 2: Perform the action, unless the message changed since
+            # the confirmation was requested.
+            pending, error = _redeem_confirmation(chat_name, "edit", message_id, new_content)
+            if error:
+                return error
+            presenter.edit_message(message_id, new_content, expected_version=pending.version, chat_name=chat_name)
             return jsonify({"message": f"Message {message_id} edited successfully."}), 200
 
+    except StaleVersionError as e:
+        return jsonify({"error": str(e)}), 409
     except ValueError as e:
         return jsonify({"error": str(e)}), 404
 
@@ -174,25 +368,129 @@ def edit_message(message_id: int):
 def delete_message(message_id: int):
     """Deletes a specified message, requiring confirmation."""
     is_confirmed = request.args.get('confirm') == 'true'
+    chat_name = presenter.chat_name
 
     try:
-        message = presenter.get_message_by_id(message_id)
-        if not message:
-            raise ValueError(f"Message with ID {message_id} not found.")
-
         if not is_confirmed:
             # Step 1: Request confirmation
+            message = presenter.get_message_by_id(message_id, chat_name=chat_name)
+            if not message:
+                raise ValueError(f"Message with ID {message_id} not found.")
+
+            token = confirmations.issue(chat_name, "delete", message.id, message.version)
             return jsonify({
                 "confirmation_required": True,
                 "message": "Please confirm that you want to delete this message.",
+                "confirmation_token": token,
+                "expires_in": confirmations.ttl,
                 "details": format_message(message)
             }), 200
         else:
             # Step 2: Perform the action
-            presenter.delete_message(message_id)
+            pending, error = _redeem_confirmation(chat_name, "delete", message_id)
+            if error:
+                return error
+            presenter.delete_message(message_id, expected_version=pending.version, chat_name=chat_name)
             return jsonify({"message": f"Message {message_id} deleted successfully."}), 200
+    except StaleVersionError as e:
+        return jsonify({"error": str(e)}), 409
     except ValueError as e:
         return jsonify({"error": str(e)}), 404
 
+# --- Profiling Endpoints ---
+
+@app.route("/debug/profiling", methods=["GET"])
+def view_profiling_config():
+    """Returns the current profiling settings."""
+    return jsonify(profiler.get_config()), 200
+
+@app.route("/debug/profiling", methods=["PUT"])
+def update_profiling_config():
+    """
+    Changes the profiling settings at runtime. Accepts 'sample_rate' (0-1)
+    and 'slow_threshold_ms' (null disables the slow-operation log).
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Request body must contain 'sample_rate' and/or 'slow_threshold_ms'"}), 400
+    try:
+        profiler.configure(
+            sample_rate=data.get("sample_rate"),
+            slow_threshold_ms=data.get("slow_threshold_ms"),
+            disable_slow_log="slow_threshold_ms" in data and data["slow_threshold_ms"] is None
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(profiler.get_config()), 200
+
+@app.route("/debug/profile", methods=["GET"])
+def view_profile():
+    """Returns the aggregated cProfile report of the sampled requests as text."""
+    sort = request.args.get("sort", "cumulative")
+    limit = request.args.get("limit", 40, type=int)
+    try:
+        return Response(profiler.format_stats(sort, limit), mimetype="text/plain"), 200
+    except KeyError:
+        return jsonify({"error": f"Unknown sort key '{sort}'."}), 400
+
+@app.route("/debug/profile", methods=["DELETE"])
+def reset_profile():
+    """Discards the aggregated profile and the slow-operation log."""
+    profiler.reset()
+    return jsonify({"message": "Profiling data cleared."}), 200
+
+@app.route("/debug/profile/dump", methods=["POST"])
+def dump_profile():
+    """Writes the aggregated cProfile data to the server's dump file."""
+    try:
+        profiler.dump_stats(profile_dump_path)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({"message": f"Profile written to '{os.path.abspath(profile_dump_path)}'."}), 200
+
+@app.route("/debug/slow_ops", methods=["GET"])
+def view_slow_ops():
+    """Returns the requests that exceeded the slow-operation threshold."""
+    return jsonify(profiler.get_slow_log()), 200
+
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    parser = argparse.ArgumentParser(description="Run the MCP server.")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Number of chat-owning worker processes. With more than one, "
+             "each chat is served by the worker that owns it."
+    )
+    parser.add_argument("--port", type=int, default=5000, help="Port to listen on.")
+    parser.add_argument(
+        "--profile-sample-rate", type=float, default=0.0,
+        help="Fraction of requests to run under cProfile (0 disables sampling)."
+    )
+    parser.add_argument(
+        "--slow-ms", type=float, default=None,
+        help="Log requests slower than this many milliseconds to /debug/slow_ops."
+    )
+    parser.add_argument(
+        "--profile-dump", default=profile_dump_path,
+        help="File written by POST /debug/profile/dump."
+    )
+    parser.add_argument(
+        "--startup-report", action="store_true",
+        help="Print how long startup took until the first request was served."
+    )
+    args = parser.parse_args()
+    if args.startup_report:
+        startup_report = StartupReport(_STARTED)
+        startup_report.mark("imports and presenter")
+    profiler.configure(sample_rate=args.profile_sample_rate, slow_threshold_ms=args.slow_ms)
+    profile_dump_path = args.profile_dump
+
+    if args.workers > 1:
+        from mcp_server.sharding import ShardedPresenter
+        # Workers hold the authoritative chat state in memory, so the
+        # reloader (which would fork a second set of workers) is disabled.
+        presenter = ShardedPresenter(args.workers)
+        if startup_report:
+            startup_report.mark("workers started")
+        app.run(debug=True, port=args.port, threaded=True, use_reloader=False)
+    else:
+        app.run(debug=True, port=args.port)
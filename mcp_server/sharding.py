@@ -0,0 +1,163 @@
+import bisect
+import hashlib
+import multiprocessing
+import os
+import sys
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from model.chat import Chat
+from model.chat_manager import ChatManager
+from presenter.presenter import BasePresenter
+
+# Chat methods a front process may invoke on the owning worker.
+_CHAT_OPS = frozenset({
+    "get_participants",
+    "add_participant",
+    "remove_participant",
+    "get_messages",
+    "get_last_messages",
+    "add_message",
+    "insert_message",
+    "get_message_by_id",
+    "edit_message",
+    "delete_message",
+    "get_changes",
+    "get_context",
+})
+
+
+class HashRing:
+    """Consistent hash ring mapping chat names to worker indexes."""
+
+    def __init__(self, num_nodes: int, replicas: int = 64):
+        if num_nodes < 1:
+            raise ValueError("A hash ring needs at least one node.")
+        self._ring = sorted(
+            (self._hash(f"{node}:{replica}"), node)
+            for node in range(num_nodes)
+            for replica in range(replicas)
+        )
+        self._keys = [key for key, _ in self._ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def get_node(self, key: str) -> int:
+        """Returns the index of the node owning the given key."""
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._ring[index][1]
+
+
+def _shard_worker(conn, history_dir: str):
+    """
+    Worker process loop. Each worker keeps the in-memory Chat for every chat
+    it owns and is the only server process writing those files.
+    """
+    chat_manager = ChatManager(history_dir)
+    chats: Dict[str, Chat] = {}
+
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+
+        op, chat_name, args, kwargs = request
+        try:
+            if op == "create_chat":
+                chat_manager.create_chat(chat_name)
+                chats[chat_name] = Chat(chat_name, chat_manager)
+                result = None
+            elif op == "get_chat":
+                result = chat_manager.get_chat(chat_name)
+            else:
+                chat = chats.get(chat_name)
+                if chat is None:
+                    chat = chats[chat_name] = Chat(chat_name, chat_manager)
+                if op == "open":
+                    result = None
+                elif op in _CHAT_OPS:
+                    result = getattr(chat, op)(*args, **kwargs)
+                else:
+                    raise ValueError(f"Unknown operation '{op}'.")
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", e))
+
+    conn.close()
+
+
+class _Shard(NamedTuple):
+    process: multiprocessing.Process
+    conn: object
+    lock: threading.Lock
+
+
+class ShardedPresenter(BasePresenter):
+    """
+    A drop-in replacement for the Presenter that spreads chats over several
+    worker processes. Every chat is owned by exactly one worker (chosen by
+    consistent hashing on the chat name) and requests are routed to it over a
+    pipe, so different chats are served in parallel on different cores.
+    """
+    def __init__(self, num_workers: int, history_dir: str = "."):
+        self.chat_manager = ChatManager(history_dir)
+        self.ring = HashRing(num_workers)
+        self._shards: List[_Shard] = []
+        for _ in range(num_workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_shard_worker, args=(child_conn, history_dir), daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self._shards.append(_Shard(process, parent_conn, threading.Lock()))
+
+        # Chats are loaded by their owning worker on first use.
+        self.chat_name = "default"
+        if not self.chat_manager.chat_exists(self.chat_name) and not self.chat_manager.has_chats():
+            self.create_chat(self.chat_name)
+
+    def _call(self, chat_name: str, op: str, *args, **kwargs):
+        """Runs an operation on the worker that owns the chat."""
+        shard = self._shards[self.ring.get_node(chat_name)]
+        with shard.lock:
+            shard.conn.send((op, chat_name, args, kwargs))
+            status, result = shard.conn.recv()
+        if status == "error":
+            raise result
+        return result
+
+    def _chat_op(self, chat_name: Optional[str], op: str, *args):
+        # The worker applies read limits itself, so only the result is sent back.
+        return self._call(chat_name or self.chat_name, op, *args)
+
+    def close(self):
+        """Stops all worker processes."""
+        for shard in self._shards:
+            with shard.lock:
+                shard.conn.send(None)
+                shard.conn.close()
+            shard.process.join()
+        self._shards = []
+
+    def get_chat_list(self) -> List[str]:
+        """Gets the list of available chats."""
+        return self.chat_manager.get_chat_list()
+
+    def switch_chat(self, chat_name: str):
+        """Switches to a different chat."""
+        self._call(chat_name, "open")
+        self.chat_name = chat_name
+
+    def create_chat(self, chat_name: str):
+        """Creates a new chat on its owning worker."""
+        self._call(chat_name, "create_chat")
+
+    def get_chat(self, chat_name: str) -> dict:
+        """Gets the details of a specific chat."""
+        return self._call(chat_name, "get_chat")
@@ -0,0 +1,72 @@
+import hashlib
+import os
+from typing import Set
+
+
+class BlobStore:
+    """
+    Content-addressed storage for large message bodies. Each blob is a file
+    named after the SHA-256 of its content, so identical bodies are stored once.
+    """
+
+    def __init__(self, blob_dir: str):
+        self.blob_dir = blob_dir
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest)
+
+    def put(self, content: str) -> str:
+        """Stores the content if it is not stored yet and returns its digest."""
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if os.path.exists(path):
+            # Mark the blob as in use again, so collect() does not remove it
+            # before the new reference has been saved.
+            os.utime(path)
+        else:
+            os.makedirs(self.blob_dir, exist_ok=True)
+            # Write to a temporary file first so readers never see a partial blob.
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest: str) -> str:
+        """Returns the content stored under the digest."""
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise ValueError(f"Invalid blob reference '{digest}'.")
+        try:
+            with open(self._path(digest), 'rb') as f:
+                return f.read().decode("utf-8")
+        except FileNotFoundError:
+            raise ValueError(f"Blob '{digest}' not found.")
+
+    def size(self, digest: str) -> int:
+        """Returns the size in bytes of the blob stored under the digest."""
+        try:
+            return os.path.getsize(self._path(digest))
+        except FileNotFoundError:
+            raise ValueError(f"Blob '{digest}' not found.")
+
+    def collect(self, referenced: Set[str], older_than: float) -> int:
+        """
+        Deletes blobs that are not in `referenced` and were last written
+        before the `older_than` timestamp. Returns how many were deleted.
+        """
+        try:
+            entries = list(os.scandir(self.blob_dir))
+        except FileNotFoundError:
+            return 0
+        deleted = 0
+        for entry in entries:
+            if len(entry.name) != 64 or entry.name in referenced:
+                continue
+            try:
+                if entry.stat().st_mtime < older_than:
+                    os.remove(entry.path)
+                    deleted += 1
+            except FileNotFoundError:
+                pass
+        return deleted
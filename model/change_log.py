@@ -0,0 +1,98 @@
+import bisect
+import json
+import os
+import threading
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+
+class ChangeLog:
+    """
+    The append-only change log of a chat, stored as one JSON entry per line:
+    {"seq", "op", "message_id", "value", "timestamp"}.
+
+    Parsed entries are kept in memory and the file is only read from where
+    the previous read stopped, so polling for changes costs the new entries
+    rather than a parse of the whole log. ChatManager hands out one instance
+    per chat, so every Chat in a process shares the parsed entries.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: List[dict] = []
+        # Kept alongside the entries so lookups can bisect on them.
+        self._seqs: List[int] = []
+        self._times: List[datetime] = []
+        # Bytes of the file parsed so far, and the file they belong to.
+        self._offset = 0
+        self._file_id: Optional[Tuple[int, int]] = None
+
+    def _reset(self) -> None:
+        self._entries, self._seqs, self._times = [], [], []
+        self._offset = 0
+        self._file_id = None
+
+    def _add(self, entries: List[dict]) -> None:
+        for entry in entries:
+            self._entries.append(entry)
+            self._seqs.append(entry["seq"])
+            self._times.append(datetime.fromisoformat(entry["timestamp"]))
+
+    def _sync(self) -> None:
+        """Parses whatever was appended to the file since the last read."""
+        try:
+            with open(self.path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if (stat.st_dev, stat.st_ino) != self._file_id or stat.st_size < self._offset:
+                    # The log was compacted (replaced) by another writer.
+                    self._reset()
+                    self._file_id = (stat.st_dev, stat.st_ino)
+                if stat.st_size == self._offset:
+                    return
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            self._reset()
+            return
+        # Only complete lines; another process may be halfway through an append.
+        end = data.rfind(b"\n") + 1
+        self._add([json.loads(line) for line in data[:end].splitlines() if line.strip()])
+        self._offset += end
+
+    def append(self, entry: dict) -> None:
+        """Appends an entry to the log."""
+        with self._lock, open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def oldest_timestamp(self) -> Optional[datetime]:
+        """Returns the time of the oldest entry, or None if the log is empty."""
+        with self._lock:
+            self._sync()
+            return self._times[0] if self._times else None
+
+    def since(self, since_seq: int, cutoff: datetime) -> Tuple[Optional[int], List[dict]]:
+        """
+        Returns the sequence number of the oldest entry not older than cutoff
+        (None if there is none) and the entries after since_seq.
+        """
+        with self._lock:
+            self._sync()
+            first = bisect.bisect_left(self._times, cutoff)
+            if first == len(self._entries):
+                return None, []
+            start = max(bisect.bisect_right(self._seqs, since_seq), first)
+            return self._seqs[first], self._entries[start:]
+
+    def compact(self, cutoff: datetime) -> List[dict]:
+        """Rewrites the log without the entries older than cutoff and returns the rest."""
+        with self._lock:
+            self._sync()
+            retained = self._entries[bisect.bisect_left(self._times, cutoff):]
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in retained)
+            os.replace(tmp_path, self.path)
+            self._reset()
+            self._sync()
+            return retained
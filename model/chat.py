@@ -1,93 +1,284 @@
+import bisect
 import json
+import os
+import threading
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from .message import Message
+from .blob_store import BlobStore
+from .message import Message, estimate_tokens, estimate_tokens_for_length
+from .timing import phase
 
 from .chat_manager import ChatManager
 
+class StaleVersionError(ValueError):
+    """Raised when a message changed since the version a caller expected."""
+
+
 class Chat:
     """Manages the chat history and participants for a single chat."""
 
+    # How long entries are kept in the change log. Clients that fall further
+    # behind than this must do a full reload.
+    CHANGE_RETENTION = timedelta(days=7)
+    # Expired entries are only removed from the log file once the oldest one
+    # is this far past the retention window, so that steady traffic does not
+    # rewrite the whole log on every change.
+    CHANGE_COMPACTION_SLACK = timedelta(days=1)
+    # Message bodies longer than this are stored in the chat's blob store
+    # and only referenced from the history file.
+    BLOB_THRESHOLD = 16 * 1024
+    # Length of the preview kept inline for out-of-line bodies.
+    BLOB_PREVIEW_LENGTH = 200
+
     def __init__(self, chat_name: str, chat_manager: ChatManager):
         self.chat_name = chat_name
         self.chat_manager = chat_manager
         self.history_file = self.chat_manager.get_chat_history_file(self.chat_name)
+        self.changes_file = self.chat_manager.get_chat_changes_file(self.chat_name)
+        self.change_log = self.chat_manager.get_change_log(self.chat_name)
+        self.blob_store = BlobStore(self.chat_manager.get_chat_blob_dir(self.chat_name))
+        # (st_ino, st_mtime_ns, st_size) of the history file as last loaded or
+        # saved. The file is only re-read when someone else (another process,
+        # such as the GUI) has changed it since.
+        self._file_stat: Optional[tuple] = None
         self.messages: List[Message] = []
         self.participants: List[str] = []
+        # Maps message IDs to their position in self.messages.
+        self._index: Dict[int, int] = {}
+        # (messages, prefix), where prefix[i] is the estimated token count of
+        # messages[:i]. Only get_context needs it, so it is built there, and
+        # dropped (set to None) whenever the messages are reloaded or changed.
+        self._token_prefix: Optional[Tuple[List[Message], List[int]]] = None
+        # ID for the next new message. Persisted, so IDs are never reused even
+        # after the newest message has been deleted.
+        self.next_id = 1
+        # Sequence number of the last entry in the change log. The log itself
+        # is kept in changes_file and only read when changes are requested.
+        self.last_seq = 0
         # Initial load when the object is created.
         self._load_data()
 
     def _load_data(self):
         """
         Loads chat history and participants from the JSON file.
-        This is called before every operation to ensure data is fresh.
+        This is called (via _refresh) before every operation to ensure data is fresh.
         """
+        with phase("load_data"):
+            try:
+                with open(self.history_file, 'r') as f:
+                    # Use a lock here in a multi-threaded server, but for separate
+                    # processes, file system atomicity is what we rely on.
+                    with phase("load_json"):
+                        data = json.load(f)
+                    self.participants = data.get("participants", [])
+                    raw_messages = data.get("messages", [])
+                    with phase("fromisoformat"):
+                        timestamps = [datetime.fromisoformat(msg["timestamp"]) for msg in raw_messages]
+                    # Out-of-line bodies are not read here; Message loads them
+                    # from the blob store the first time their content is used.
+                    self.messages = [
+                        Message(
+                            id=msg["id"],
+                            name=msg["name"],
+                            timestamp=timestamp,
+                            content=msg.get("content"),
+                            version=msg.get("version", 1),
+                            tokens=msg.get("tokens"),
+                            blob_ref=msg.get("content_ref"),
+                            blob_preview=msg.get("preview"),
+                            content_loader=self.blob_store.get
+                        ) for msg, timestamp in zip(raw_messages, timestamps)
+                    ]
+                    self.next_id = data.get("next_id")
+                    if self.next_id is None:
+                        # Histories written before the counter was stored.
+                        self.next_id = max((msg.id for msg in self.messages), default=0) + 1
+                    self.last_seq = data.get("last_seq", 0)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self.participants = []
+                self.messages = []
+                self.next_id = 1
+                self.last_seq = 0
+            self._file_stat = self._stat_history_file()
+            self._reindex()
+
+    def _reindex(self):
+        """Rebuilds the message ID index after the message list changed."""
+        self._index = {msg.id: i for i, msg in enumerate(self.messages)}
+        self._token_prefix = None
+
+    def _build_token_prefix(self, messages: List[Message]) -> List[int]:
+        """Builds the running token totals used by get_context."""
+        prefix = [0]
+        for msg in messages:
+            if msg.tokens is None:
+                # Histories written before estimates were stored. Out-of-line
+                # bodies are estimated from their size rather than loaded.
+                if msg.is_content_loaded:
+                    msg.tokens = estimate_tokens(msg.name, msg.content)
+                else:
+                    msg.tokens = estimate_tokens_for_length(msg.name, self.blob_store.size(msg.blob_ref))
+            prefix.append(prefix[-1] + msg.tokens)
+        return prefix
+
+    def _stat_history_file(self) -> Optional[tuple]:
         try:
-            with open(self.history_file, 'r') as f:
-                # Use a lock here in a multi-threaded server, but for separate
-                # processes, file system atomicity is what we rely on.
-                data = json.load(f)
-                self.participants = data.get("participants", [])
-                self.messages = [
-                    Message(
-                        id=msg["id"],
-                        name=msg["name"],
-                        timestamp=datetime.fromisoformat(msg["timestamp"]),
-                        content=msg["content"]
-                    ) for msg in data.get("messages", [])
-                ]
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.participants = []
-            self.messages = []
+            stat = os.stat(self.history_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self):
+        """Reloads the chat from disk if the file changed since it was last loaded or saved."""
+        if self._stat_history_file() != self._file_stat:
+            self._load_data()
+
+    def _externalize(self, msg: Message) -> None:
+        """Moves a large message body into the blob store if it is not there yet."""
+        if msg.blob_ref is None and len(msg.content) > self.BLOB_THRESHOLD:
+            # The body is dropped from memory once stored; it is read back
+            # from the blob store if it is needed again.
+            msg.store_out_of_line(self.blob_store.put(msg.content),
+                                  msg.content[:self.BLOB_PREVIEW_LENGTH], self.blob_store.get)
+
+    def _content_value(self, msg: Message) -> Any:
+        """Returns the message body as it is recorded in the change log."""
+        if msg.blob_ref is not None:
+            return {"content_ref": msg.blob_ref}
+        return msg.content
+
+    def _serialize_message(self, msg: Message) -> dict:
+        data = {
+            "id": msg.id,
+            "name": msg.name,
+            "timestamp": msg.timestamp.isoformat(),
+            "version": msg.version,
+            "tokens": msg.tokens
+        }
+        self._externalize(msg)
+        if msg.blob_ref is not None:
+            data["content_ref"] = msg.blob_ref
+            data["preview"] = msg.blob_preview
+        else:
+            data["content"] = msg.content
+        return data
 
     def _save_data(self):
         """Saves the current chat state to the JSON file."""
-        with open(self.history_file, 'w') as f:
+        with phase("save_data"):
             data = {
                 "participants": self.participants,
-                "messages": [
-                    {
-                        "id": msg.id,
-                        "name": msg.name,
-                        "timestamp": msg.timestamp.isoformat(),
-                        "content": msg.content
-                    } for msg in self.messages
-                ]
+                "messages": [self._serialize_message(msg) for msg in self.messages],
+                "next_id": self.next_id,
+                "last_seq": self.last_seq
             }
-            json.dump(data, f, indent=4)
+            # Write to a temporary file first so readers never see a partial
+            # history (which would reset next_id and last_seq on load). The
+            # name is unique per thread, since the server writes from several.
+            tmp_file = f"{self.history_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_file, 'w') as f:
+                    json.dump(data, f, indent=4)
+                os.replace(tmp_file, self.history_file)
+            except BaseException:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+                # The unsaved change is discarded by the next reload.
+                self._file_stat = None
+                raise
+        self._file_stat = self._stat_history_file()
+
+    def _record_change(self, op: str, message_id: int, value: Any) -> None:
+        """
+        Appends an entry to the change log and drops entries that have fallen
+        out of the retention window. Assumes data is already loaded.
+        """
+        now = datetime.now()
+        self.last_seq += 1
+        self.change_log.append({
+            "seq": self.last_seq,
+            "op": op,
+            "message_id": message_id,
+            "value": value,
+            "timestamp": now.isoformat()
+        })
+
+        cutoff = now - self.CHANGE_RETENTION
+        if self.change_log.oldest_timestamp() < cutoff - self.CHANGE_COMPACTION_SLACK:
+            self._compact_changes(cutoff)
+
+    def _compact_changes(self, cutoff: datetime) -> None:
+        """
+        Rewrites the change log without the entries older than cutoff, then
+        deletes the blobs that neither a message nor a remaining entry uses.
+        """
+        changes = self.change_log.compact(cutoff)
+        referenced = {msg.blob_ref for msg in self.messages if msg.blob_ref is not None}
+        referenced.update(
+            change["value"]["content_ref"] for change in changes
+            if isinstance(change["value"], dict) and "content_ref" in change["value"]
+        )
+        # Blobs written within the retention window are kept, since another
+        # writer may not have saved its reference to them yet.
+        self.blob_store.collect(referenced, older_than=cutoff.timestamp())
+
+    def get_changes(self, since_seq: int = 0) -> dict:
+        """
+        Returns the change log entries after since_seq. If entries the client
+        has not seen were already truncated, or the client is ahead of this
+        chat (e.g. the history was restored from a backup), "reset" is true
+        and the client must reload the full history.
+        """
+        self._refresh()
+        with phase("load_changes"):
+            first_seq, changes = self.change_log.since(since_seq, datetime.now() - self.CHANGE_RETENTION)
+        if first_seq is None:
+            first_seq = self.last_seq + 1
+        return {
+            "last_seq": self.last_seq,
+            "reset": since_seq < first_seq - 1 or since_seq > self.last_seq,
+            "changes": changes
+        }
 
     def get_participants(self) -> List[str]:
-        self._load_data()
+        self._refresh()
         return self.participants
 
     def add_participant(self, name: str) -> None:
-        self._load_data()
+        self._refresh()
         if name and name not in self.participants:
             self.participants.append(name)
             self._save_data()
 
     def remove_participant(self, name: str) -> None:
-        self._load_data()
+        self._refresh()
         if name in self.participants:
             self.participants.remove(name)
             self._save_data()
 
     def get_messages(self) -> List[Message]:
-        self._load_data()
+        self._refresh()
         return self.messages
 
+    def get_last_messages(self, limit: Optional[int]) -> List[Message]:
+        """Returns the last `limit` messages, or all of them if limit is None."""
+        self._refresh()
+        if limit is None:
+            return self.messages
+        return self.messages[max(len(self.messages) - limit, 0):]
+
     def _get_next_message_id(self) -> int:
         # This is an internal method, it assumes data is already loaded.
-        if not self.messages:
-            return 1
-        return max(msg.id for msg in self.messages) + 1
+        message_id = self.next_id
+        self.next_id += 1
+        return message_id
 
     def add_message(self, name: str, content: str) -> Message:
         return self.insert_message(name, content)
 
     def insert_message(self, name: str, content: str, after_id: Optional[int] = None) -> Message:
-        self._load_data()
+        self._refresh()
         if name not in self.participants:
             raise ValueError(f"'{name}' is not an approved participant.")
 
@@ -97,50 +288,88 @@ class Chat:
             id=self._get_next_message_id(),
             name=name,
             timestamp=now,
-            content=content
+            content=content,
+            tokens=estimate_tokens(name, content)
         )
 
         if after_id is None:
             self.messages.append(new_message)
+            self._index[new_message.id] = len(self.messages) - 1
+            if self._token_prefix is not None:
+                prefix = self._token_prefix[1]
+                prefix.append(prefix[-1] + new_message.tokens)
         else:
-            index = -1
-            for i, msg in enumerate(self.messages):
-                if msg.id == after_id:
-                    index = i
-                    break
-            if index != -1:
-                self.messages.insert(index + 1, new_message)
-            else:
+            index = self._index.get(after_id)
+            if index is None:
                 raise ValueError(f"Message with ID {after_id} not found.")
+            self.messages.insert(index + 1, new_message)
+            self._reindex()
 
+        self._externalize(new_message)
+        value = {
+            "name": new_message.name,
+            "timestamp": new_message.timestamp.isoformat(),
+            "after_id": after_id
+        }
+        if new_message.blob_ref is not None:
+            value["content_ref"] = new_message.blob_ref
+        else:
+            value["content"] = new_message.content
+        self._record_change("insert", new_message.id, value)
         self._save_data()
         return new_message
 
+    def get_context(self, max_tokens: int) -> List[Message]:
+        """
+        Returns the most recent messages whose estimated size fits within
+        max_tokens, oldest first. Uses the running token totals, so finding
+        the cut-off is a binary search rather than a scan.
+        """
+        self._refresh()
+        messages = self.messages
+        # The cached totals are only used if they were built for this list,
+        # in case another thread reloaded the chat in between.
+        if self._token_prefix is None or self._token_prefix[0] is not messages:
+            self._token_prefix = (messages, self._build_token_prefix(messages))
+        prefix = self._token_prefix[1]
+        start = bisect.bisect_left(prefix, prefix[-1] - max_tokens)
+        return messages[start:]
+
     def get_message_by_id(self, message_id: int) -> Optional[Message]:
-        self._load_data()
-        for msg in self.messages:
-            if msg.id == message_id:
-                return msg
-        return None
+        self._refresh()
+        index = self._index.get(message_id)
+        return self.messages[index] if index is not None else None
 
-    def edit_message(self, message_id: int, new_content: str) -> None:
-        self._load_data()
-        message_to_edit = None
-        for msg in self.messages:
-            if msg.id == message_id:
-                message_to_edit = msg
-                break
-
-        if message_to_edit:
-            message_to_edit.content = new_content
-            self._save_data()
-        else:
+    def _find_for_update(self, message_id: int, expected_version: Optional[int]) -> int:
+        """
+        Returns the position of a message about to be changed, checking that
+        it is still at the expected version. Assumes data is already loaded.
+        """
+        index = self._index.get(message_id)
+        if index is None:
             raise ValueError(f"Message with ID {message_id} not found.")
+        version = self.messages[index].version
+        if expected_version is not None and version != expected_version:
+            raise StaleVersionError(
+                f"Message with ID {message_id} has changed (version {version}, expected {expected_version})."
+            )
+        return index
 
-    def delete_message(self, message_id: int) -> None:
-        self._load_data()
-        initial_len = len(self.messages)
-        self.messages = [msg for msg in self.messages if msg.id != message_id]
-        if len(self.messages) == initial_len:
-             raise ValueError(f"Message with ID {message_id} not found.")
+    def edit_message(self, message_id: int, new_content: str, expected_version: Optional[int] = None) -> None:
+        self._refresh()
+        message_to_edit = self.messages[self._find_for_update(message_id, expected_version)]
+        message_to_edit.content = new_content
+        message_to_edit.version += 1
+        message_to_edit.tokens = estimate_tokens(message_to_edit.name, new_content)
+        self._token_prefix = None
+        self._externalize(message_to_edit)
+        self._record_change("edit", message_id, self._content_value(message_to_edit))
+        self._save_data()
+
+    def delete_message(self, message_id: int, expected_version: Optional[int] = None) -> None:
+        self._refresh()
+        del self.messages[self._find_for_update(message_id, expected_version)]
+        self._reindex()
+        # Deletes leave a tombstone in the change log.
+        self._record_change("delete", message_id, None)
         self._save_data()
@@ -1,6 +1,8 @@
 import os
 import json
-from typing import List
+from typing import Dict, List
+
+from .change_log import ChangeLog
 
 class ChatManager:
     """Manages the different chat histories."""
@@ -8,20 +10,49 @@ class ChatManager:
     def __init__(self, history_dir: str = "."):
         self.history_dir = history_dir
         self.chat_history_prefix = "chat_history_"
+        # One change log per chat, shared by every Chat using this manager.
+        self._change_logs: Dict[str, ChangeLog] = {}
+
+    def _is_history_file(self, filename: str) -> bool:
+        return filename.startswith(self.chat_history_prefix) and filename.endswith(".json")
 
     def get_chat_list(self) -> List[str]:
         """Returns a list of available chat names."""
         chats = []
         for filename in os.listdir(self.history_dir):
-            if filename.startswith(self.chat_history_prefix) and filename.endswith(".json"):
+            if self._is_history_file(filename):
                 chat_name = filename[len(self.chat_history_prefix):-len(".json")]
                 chats.append(chat_name)
         return chats
 
+    def has_chats(self) -> bool:
+        """Returns whether any chat exists, stopping at the first one found."""
+        with os.scandir(self.history_dir) as entries:
+            return any(self._is_history_file(entry.name) for entry in entries)
+
     def get_chat_history_file(self, chat_name: str) -> str:
         """Returns the full path to the chat history file."""
         return os.path.join(self.history_dir, f"{self.chat_history_prefix}{chat_name}.json")
 
+    def get_chat_blob_dir(self, chat_name: str) -> str:
+        """Returns the directory holding the chat's out-of-line message bodies."""
+        return os.path.join(self.history_dir, f"{self.chat_history_prefix}{chat_name}.blobs")
+
+    def get_chat_changes_file(self, chat_name: str) -> str:
+        """Returns the path to the chat's append-only change log."""
+        return os.path.join(self.history_dir, f"{self.chat_history_prefix}{chat_name}.changes.jsonl")
+
+    def get_change_log(self, chat_name: str) -> ChangeLog:
+        """Returns the change log of the chat."""
+        change_log = self._change_logs.get(chat_name)
+        if change_log is None:
+            change_log = self._change_logs.setdefault(chat_name, ChangeLog(self.get_chat_changes_file(chat_name)))
+        return change_log
+
+    def chat_exists(self, chat_name: str) -> bool:
+        """Returns whether a history file exists for the chat."""
+        return os.path.exists(self.get_chat_history_file(chat_name))
+
     def create_chat(self, chat_name: str):
         """Creates a new chat history file."""
         history_file = self.get_chat_history_file(chat_name)
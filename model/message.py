@@ -1,10 +1,100 @@
 import dataclasses
 from datetime import datetime
+from typing import Callable, Optional
 
-@dataclasses.dataclass
+# Rough token estimate: about four characters per token, plus a fixed cost
+# for the ID, sender and timestamp an agent sees with every message.
+CHARS_PER_TOKEN = 4
+MESSAGE_TOKEN_OVERHEAD = 12
+
+def estimate_tokens(name: str, content: str) -> int:
+    """Estimates how many tokens a message takes up in an agent's context."""
+    return estimate_tokens_for_length(name, len(content))
+
+def estimate_tokens_for_length(name: str, content_length: int) -> int:
+    """Like estimate_tokens, for a body of which only the length is known."""
+    return MESSAGE_TOKEN_OVERHEAD + -(-(len(name) + content_length) // CHARS_PER_TOKEN)
+
+@dataclasses.dataclass(init=False, eq=False)
 class Message:
     """Represents a single chat message."""
     id: int
     name: str
     timestamp: datetime
-    content: str
+    # Incremented on every edit, so stale confirmations can be detected.
+    version: int = 1
+    # Estimated size in tokens, computed when the message is written.
+    tokens: Optional[int] = None
+    # Set when the body is stored out of line in the chat's blob store.
+    # The content is then only read, via content_loader, on first access.
+    blob_ref: Optional[str] = None
+    blob_preview: Optional[str] = dataclasses.field(default=None, repr=False)
+    content_loader: Optional[Callable[[str], str]] = dataclasses.field(default=None, repr=False)
+    # The body if it is inline or already loaded, otherwise None. It is read
+    # through the `content` property; repr shows the field as it is, so it
+    # never reads from the blob store.
+    _content: Optional[str] = None
+
+    def __init__(self, id: int, name: str, timestamp: datetime, content: Optional[str],
+                 version: int = 1, tokens: Optional[int] = None, blob_ref: Optional[str] = None,
+                 blob_preview: Optional[str] = None, content_loader: Optional[Callable[[str], str]] = None):
+        self.id = id
+        self.name = name
+        self.timestamp = timestamp
+        self.version = version
+        self.tokens = tokens
+        self.blob_ref = blob_ref
+        self.blob_preview = blob_preview
+        self.content_loader = content_loader
+        self._content = content
+
+    @property
+    def content(self) -> str:
+        if self._content is None and self.blob_ref is not None:
+            self._content = self.content_loader(self.blob_ref)
+        return self._content
+
+    @content.setter
+    def content(self, value: str) -> None:
+        self._content = value
+        # New content no longer matches any stored blob.
+        self.blob_ref = None
+
+    def store_out_of_line(self, blob_ref: str, preview: str, content_loader: Callable[[str], str]) -> None:
+        """Marks the body as stored in the blob store and drops it from memory."""
+        self.blob_ref = blob_ref
+        self.blob_preview = preview
+        self.content_loader = content_loader
+        self._content = None
+
+    def __getstate__(self) -> dict:
+        # A loaded out-of-line body is not pickled (e.g. sent from a sharded
+        # server's worker); the receiver loads it again if it needs it.
+        state = self.__dict__.copy()
+        if self.blob_ref is not None:
+            state["_content"] = None
+        return state
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        # An out-of-line body is identified by its blob reference, so
+        # comparing messages never loads it.
+        return self._compare_key() == other._compare_key()
+
+    # Messages are mutable, so they are not hashable.
+    __hash__ = None
+
+    def _compare_key(self) -> tuple:
+        content = self._content if self.blob_ref is None else None
+        return self.id, self.name, self.timestamp, content, self.version, self.blob_ref
+
+    @property
+    def is_content_loaded(self) -> bool:
+        return self._content is not None
+
+    def get_preview(self, length: int) -> str:
+        """Returns at most `length` characters of the content, loading it only if needed."""
+        if not self.is_content_loaded and self.blob_preview is not None and length <= len(self.blob_preview):
+            return self.blob_preview[:length]
+        return self.content[:length]
@@ -0,0 +1,50 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Per-thread phase recorder. Recording is off unless a caller (e.g. the
+# server's slow-operation log) starts it for the current thread.
+_local = threading.local()
+
+
+def start_recording() -> None:
+    """Starts collecting phase timings for the current thread."""
+    _local.phases = {}
+
+
+def stop_recording() -> Optional[Dict[str, float]]:
+    """Stops collecting and returns the seconds spent in each phase."""
+    phases = getattr(_local, "phases", None)
+    _local.phases = None
+    return phases
+
+
+@contextmanager
+def phase(name: str):
+    """Adds the time spent in the block to the named phase, if recording."""
+    phases = getattr(_local, "phases", None)
+    if phases is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - started
+
+
+class StartupReport:
+    """Records named startup milestones, in milliseconds since `started`."""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.milestones = []
+
+    def mark(self, label: str) -> None:
+        self.milestones.append((label, (time.perf_counter() - self.started) * 1000))
+
+    def format(self) -> str:
+        lines = ["Startup timing:"]
+        lines.extend(f"  {label:<28}{ms:>9.1f} ms" for label, ms in self.milestones)
+        return "\n".join(lines)
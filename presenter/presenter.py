@@ -1,82 +1,211 @@
 import sys
 import os
-from typing import List
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from model.chat import Chat
+from model.blob_store import BlobStore
 from model.chat_manager import ChatManager
 from model.message import Message
 
-class Presenter:
+# Upper bound on the threads used to load chats for a batch read.
+MAX_BATCH_WORKERS = 8
+# How many recently used chats are kept loaded. A loaded chat is only re-read
+# when its history file changes, and keeps its token totals.
+MAX_CACHED_CHATS = 8
+
+class BasePresenter:
     """
-    The Presenter acts as a bridge between the Model (Chat) and the Views.
+    The chat operations shared by the Presenter and the ShardedPresenter.
+    Subclasses provide chat_manager, chat_name and _chat_op, which runs a
+    Chat method on the given chat (or on the current chat if no name is given).
     """
-    def __init__(self):
-        # The presenter creates and owns the model instance
-        self.chat_manager = ChatManager()
-        self.chat_name = "default"
-        if not self.chat_manager.get_chat_list():
-            self.chat_manager.create_chat(self.chat_name)
-
-        self.model = Chat(self.chat_name, self.chat_manager)
-
-    def get_chat_list(self) -> List[str]:
-        """Gets the list of available chats."""
-        return self.chat_manager.get_chat_list()
-
-    def switch_chat(self, chat_name: str):
-        """Switches to a different chat."""
-        self.chat_name = chat_name
-        self.model = Chat(self.chat_name, self.chat_manager)
-
-    def create_chat(self, chat_name: str):
-        """Creates a new chat."""
-        self.chat_manager.create_chat(chat_name)
-
-    def get_chat(self, chat_name: str) -> dict:
-        """Gets the details of a specific chat."""
-        return self.chat_manager.get_chat(chat_name)
-
-    def get_participants(self) -> List[str]:
+    chat_manager: ChatManager
+    chat_name: str
+
+    def _chat_op(self, chat_name: Optional[str], op: str, *args):
+        raise NotImplementedError
+
+    def _require_chat(self, chat_name: str) -> None:
+        if not self.chat_manager.chat_exists(chat_name):
+            raise ValueError(f"Chat '{chat_name}' not found.")
+
+    def get_changes(self, chat_name: str, since_seq: int = 0) -> dict:
+        """Gets the change log of a chat after the given sequence number."""
+        self._require_chat(chat_name)
+        return self._chat_op(chat_name, "get_changes", since_seq)
+
+    def get_context(self, chat_name: str, max_tokens: int) -> List[Message]:
+        """Gets the most recent messages of a chat that fit in a token budget."""
+        self._require_chat(chat_name)
+        return self._chat_op(chat_name, "get_context", max_tokens)
+
+    def read_chats(self, chat_requests: List[dict]) -> List[dict]:
+        """
+        Reads several chats at once, concurrently on a bounded thread pool and
+        without switching the current chat. Each request has a "name" and
+        optionally "since_seq" (return the change feed after that cursor) or
+        "limit" (return only the last N messages).
+        """
+        if not chat_requests:
+            return []
+        # Imported here to keep it off the startup path.
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(MAX_BATCH_WORKERS, len(chat_requests))) as pool:
+            return list(pool.map(self._read_chat, chat_requests))
+
+    def _read_chat(self, chat_request: dict) -> dict:
+        name = chat_request["name"]
+        try:
+            self._require_chat(name)
+            if chat_request.get("since_seq") is not None:
+                return {"name": name, "changes": self._chat_op(name, "get_changes", chat_request["since_seq"])}
+            return {"name": name, "messages": self._chat_op(name, "get_last_messages", chat_request.get("limit"))}
+        except ValueError as e:
+            return {"name": name, "error": str(e)}
+        except Exception as e:
+            # A malformed history fails its own entry, not the whole batch.
+            return {"name": name, "error": f"Chat '{name}' could not be read: {e!r}"}
+
+    def get_blob(self, chat_name: str, digest: str) -> str:
+        """Gets an out-of-line message body of a chat."""
+        # Blobs are immutable, so they can be read without going through the chat.
+        return BlobStore(self.chat_manager.get_chat_blob_dir(chat_name)).get(digest)
+
+    # The methods below act on the current chat unless a chat name is given.
+    # Concurrent server requests pass the name explicitly, so that another
+    # request switching chats cannot redirect them halfway through.
+
+    def get_participants(self, chat_name: Optional[str] = None) -> List[str]:
         """Gets the list of participants from the model."""
-        return self.model.get_participants()
+        return self._chat_op(chat_name, "get_participants")
 
-    def add_participant(self, name: str) -> None:
+    def add_participant(self, name: str, chat_name: Optional[str] = None) -> None:
         """Adds a participant via the model."""
         # Basic validation can happen here if needed,
         # but for now, we delegate to the model.
-        self.model.add_participant(name)
+        self._chat_op(chat_name, "add_participant", name)
 
-    def remove_participant(self, name: str) -> None:
+    def remove_participant(self, name: str, chat_name: Optional[str] = None) -> None:
         """Removes a participant via the model."""
-        self.model.remove_participant(name)
+        self._chat_op(chat_name, "remove_participant", name)
 
-    def get_messages(self) -> List[Message]:
+    def get_messages(self, chat_name: Optional[str] = None) -> List[Message]:
         """Gets the list of messages from the model."""
-        return self.model.get_messages()
+        return self._chat_op(chat_name, "get_messages")
 
-    def add_message(self, name: str, content: str) -> Message:
+    def add_message(self, name: str, content: str, chat_name: Optional[str] = None) -> Message:
         """Adds a message via the model."""
-        return self.model.add_message(name, content)
+        return self._chat_op(chat_name, "add_message", name, content)
 
-    def insert_message(self, name: str, content: str, after_id: int) -> Message:
+    def insert_message(self, name: str, content: str, after_id: int, chat_name: Optional[str] = None) -> Message:
         """Inserts a message via the model."""
-        return self.model.insert_message(name, content, after_id)
+        return self._chat_op(chat_name, "insert_message", name, content, after_id)
 
-    def edit_message(self, message_id: int, new_content: str) -> None:
+    def edit_message(self, message_id: int, new_content: str, expected_version: Optional[int] = None,
+                     chat_name: Optional[str] = None) -> None:
         """Edits a message via the model."""
         # The user approval logic will be handled by the view
-        # before this method is ever called.
-        self.model.edit_message(message_id, new_content)
+        # before this method is ever called. Passing the version the user
+        # approved makes the edit fail if the message changed meanwhile.
+        self._chat_op(chat_name, "edit_message", message_id, new_content, expected_version)
 
-    def delete_message(self, message_id: int) -> None:
+    def delete_message(self, message_id: int, expected_version: Optional[int] = None,
+                       chat_name: Optional[str] = None) -> None:
         """Deletes a message via the model."""
         # The user approval logic will be handled by the view
         # before this method is ever called.
-        self.model.delete_message(message_id)
+        self._chat_op(chat_name, "delete_message", message_id, expected_version)
 
-    def get_message_by_id(self, message_id: int):
+    def get_message_by_id(self, message_id: int, chat_name: Optional[str] = None):
         """Finds a message by its ID via the model."""
-        return self.model.get_message_by_id(message_id)
+        return self._chat_op(chat_name, "get_message_by_id", message_id)
+
+class Presenter(BasePresenter):
+    """
+    The Presenter acts as a bridge between the Model (Chat) and the Views.
+    """
+    def __init__(self):
+        # The presenter creates and owns the model instance. The chat itself
+        # is only loaded on first use, so startup does not depend on the size
+        # of the history directory.
+        self.chat_manager = ChatManager()
+        self.chat_name = "default"
+        if not self.chat_manager.chat_exists(self.chat_name) and not self.chat_manager.has_chats():
+            self.chat_manager.create_chat(self.chat_name)
+
+        self._model: Optional[Chat] = None
+        # Recently used chat models, including the current one, oldest first.
+        self._cached_models: "OrderedDict[str, Chat]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Serializes the operations on each chat, since server requests and
+        # batch reads run on several threads and may share a model.
+        self._chat_locks: Dict[str, threading.Lock] = {}
+
+    @property
+    def model(self) -> Chat:
+        """The model of the current chat, loaded on first access."""
+        if self._model is None:
+            self._model = self._cached_model(self.chat_name)
+        return self._model
+
+    def _cached_model(self, chat_name: str) -> Chat:
+        """Returns the chat's model from the cache, loading it if needed."""
+        with self._cache_lock:
+            model = self._cached_models.pop(chat_name, None)
+        if model is None:
+            model = Chat(chat_name, self.chat_manager)
+        self._cache_model(model)
+        return model
+
+    def _cache_model(self, model: Chat) -> None:
+        with self._cache_lock:
+            self._cached_models[model.chat_name] = model
+            self._cached_models.move_to_end(model.chat_name)
+            while len(self._cached_models) > MAX_CACHED_CHATS:
+                self._cached_models.popitem(last=False)
+
+    @property
+    def loaded_model(self) -> Optional[Chat]:
+        """The model of the current chat if it has been loaded, otherwise None."""
+        return self._model
+
+    def _chat(self, chat_name: Optional[str]) -> Chat:
+        """The model of the given chat, or of the current chat if no name is given."""
+        if chat_name is None:
+            return self.model
+        if chat_name == self.chat_name:
+            model = self.model
+            # Another thread may have switched chats in between.
+            if model.chat_name == chat_name:
+                return model
+        return self._cached_model(chat_name)
+
+    def _chat_op(self, chat_name: Optional[str], op: str, *args):
+        model = self._chat(chat_name)
+        with self._cache_lock:
+            lock = self._chat_locks.setdefault(model.chat_name, threading.Lock())
+        with lock:
+            return getattr(model, op)(*args)
+
+    def get_chat_list(self) -> List[str]:
+        """Gets the list of available chats."""
+        return self.chat_manager.get_chat_list()
+
+    def switch_chat(self, chat_name: str):
+        """Switches to a different chat."""
+        self.chat_name = chat_name
+        # The chat is loaded (or taken from the cache) on first use.
+        self._model = None
+
+    def create_chat(self, chat_name: str):
+        """Creates a new chat."""
+        self.chat_manager.create_chat(chat_name)
+
+    def get_chat(self, chat_name: str) -> dict:
+        """Gets the details of a specific chat."""
+        return self.chat_manager.get_chat(chat_name)
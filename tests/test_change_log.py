@@ -0,0 +1,70 @@
+import unittest
+import json
+import os
+import sys
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+
+# Add the project root to the Python path to allow importing from 'model'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from model.change_log import ChangeLog
+
+class TestChangeLog(unittest.TestCase):
+
+    def setUp(self):
+        """Use a change log in a scratch directory."""
+        self.log_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.log_dir, "chat_history_test.changes.jsonl")
+        self.log = ChangeLog(self.path)
+        self.long_ago = datetime.now() - timedelta(days=30)
+
+    def tearDown(self):
+        """Remove the scratch directory."""
+        shutil.rmtree(self.log_dir)
+
+    def _entry(self, seq, timestamp=None):
+        return {"seq": seq, "op": "insert", "message_id": seq, "value": str(seq),
+                "timestamp": (timestamp or datetime.now()).isoformat()}
+
+    def test_only_new_entries_parsed(self):
+        """Test that a read only parses what was appended since the previous one."""
+        for seq in range(1, 4):
+            self.log.append(self._entry(seq))
+        self.assertEqual(len(self.log.since(0, self.long_ago)[1]), 3)
+
+        self.log.append(self._entry(4))
+        with mock.patch("model.change_log.json.loads", wraps=json.loads) as loads:
+            first_seq, changes = self.log.since(3, self.long_ago)
+        self.assertEqual(loads.call_count, 1)
+        self.assertEqual((first_seq, [c["seq"] for c in changes]), (1, [4]))
+
+    def test_partial_line_left_for_later(self):
+        """Test that a line still being appended by another process is not parsed yet."""
+        self.log.append(self._entry(1))
+        with open(self.path, "a") as f:
+            f.write(json.dumps(self._entry(2))[:10])
+        self.assertEqual([c["seq"] for c in self.log.since(0, self.long_ago)[1]], [1])
+
+    def test_expired_entries_skipped(self):
+        """Test that entries older than the cutoff are not returned."""
+        self.log.append(self._entry(1, self.long_ago))
+        self.log.append(self._entry(2))
+        first_seq, changes = self.log.since(0, datetime.now() - timedelta(days=7))
+        self.assertEqual((first_seq, [c["seq"] for c in changes]), (2, [2]))
+
+    def test_compaction_by_another_instance_detected(self):
+        """Test that a log replaced by another writer is read again from the start."""
+        self.log.append(self._entry(1, self.long_ago))
+        self.log.append(self._entry(2))
+        self.assertEqual(self.log.oldest_timestamp(), self.long_ago)
+
+        other = ChangeLog(self.path)
+        self.assertEqual([c["seq"] for c in other.compact(datetime.now() - timedelta(days=7))], [2])
+        other.append(self._entry(3))
+        self.assertEqual([c["seq"] for c in self.log.since(0, self.long_ago)[1]], [2, 3])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+import os
+import sys
+import time
+
+# Add the project root to the Python path to allow importing from 'mcp_server'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mcp_server.confirmations import ConfirmationCache
+
+class TestConfirmationCache(unittest.TestCase):
+
+    def test_token_redeems_once(self):
+        """Test that a token returns its pending action exactly once."""
+        cache = ConfirmationCache()
+        token = cache.issue("default", "edit", 3, 2, "New content")
+        pending = cache.redeem(token)
+        self.assertEqual((pending.chat_name, pending.action, pending.message_id, pending.version, pending.new_content),
+                         ("default", "edit", 3, 2, "New content"))
+        self.assertIsNone(cache.redeem(token))
+
+    def test_unknown_token(self):
+        """Test that unknown tokens are rejected."""
+        self.assertIsNone(ConfirmationCache().redeem("not-a-token"))
+
+    def test_token_expires(self):
+        """Test that tokens are evicted after their TTL."""
+        cache = ConfirmationCache(ttl=0.01)
+        token = cache.issue("default", "delete", 1, 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.redeem(token))
+
+    def test_oldest_token_evicted_when_full(self):
+        """Test that the cache drops its oldest tokens beyond max_entries."""
+        cache = ConfirmationCache(max_entries=2)
+        tokens = [cache.issue("default", "delete", i, 1) for i in range(3)]
+        self.assertIsNone(cache.redeem(tokens[0]))
+        self.assertEqual(cache.redeem(tokens[1]).message_id, 1)
+        self.assertEqual(cache.redeem(tokens[2]).message_id, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from unittest import mock
+
+# Add the project root to the Python path to allow importing from 'tools'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from model.chat import Chat
+from model.chat_manager import ChatManager
+from tools.load_generator import CHAT_NAME, check_consistency, main, parse_mix, percentile
+
+class TestLoadGenerator(unittest.TestCase):
+
+    def setUp(self):
+        """Create a scratch history directory with the load test chat."""
+        self.history_dir = tempfile.mkdtemp()
+        self.chat_manager = ChatManager(self.history_dir)
+        self.chat_manager.create_chat(CHAT_NAME)
+        self.chat = Chat(CHAT_NAME, self.chat_manager)
+        self.chat.add_participant("agent-0")
+
+    def tearDown(self):
+        """Remove the scratch directory."""
+        shutil.rmtree(self.history_dir)
+
+    def test_parse_mix(self):
+        """Test parsing of operation weights."""
+        self.assertEqual(parse_mix("read=3, append=1"), {"read": 3, "append": 1})
+        with self.assertRaises(ValueError):
+            parse_mix("explode=1")
+        with self.assertRaises(ValueError):
+            parse_mix("read=0")
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile(values, 100), 100.0)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_consistency_detects_lost_and_resurrected_writes(self):
+        """Test that the check compares acknowledged writes with the file."""
+        kept = self.chat.add_message("agent-0", "[agent-0-0] append")
+        self.chat.add_message("agent-0", "[agent-0-2] append")
+        result = {
+            "written": {"agent-0-0": kept.id, "agent-0-1": 99, "agent-0-2": 3},
+            "edited": ["agent-0-0"],
+            "deleted": ["agent-0-2"],
+        }
+        report = check_consistency(self.history_dir, [result])
+        self.assertFalse(report["corrupted"])
+        self.assertEqual(report["lost_writes"], ["agent-0-1"])
+        self.assertEqual(report["lost_edits"], ["agent-0-0"])
+        self.assertEqual(report["resurrected_deletes"], ["agent-0-2"])
+        self.assertEqual(report["duplicate_ids"], [])
+
+    def test_consistency_detects_corruption(self):
+        """Test that an unparseable history file is reported."""
+        with open(self.chat_manager.get_chat_history_file(CHAT_NAME), 'w') as f:
+            f.write('{"participants": [')
+        self.assertTrue(check_consistency(self.history_dir, [])["corrupted"])
+
+    def test_server_url_requires_history_dir(self):
+        """Test that invalid arguments are rejected before a temporary directory is created."""
+        argv = ["load_generator.py", "--server-url", "http://127.0.0.1:1"]
+        with mock.patch.object(sys, "argv", argv), mock.patch("tempfile.mkdtemp") as mkdtemp, \
+                mock.patch("sys.stderr"):
+            with self.assertRaises(SystemExit):
+                main()
+        mkdtemp.assert_not_called()
+
+if __name__ == "__main__":
+    unittest.main()
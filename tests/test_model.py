@@ -1,12 +1,16 @@
 import unittest
+import json
 import os
+import pickle
+import shutil
 import sys
 from datetime import datetime, timedelta
+from unittest import mock
 
 # Add the project root to the Python path to allow importing from 'model'
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from model.chat import Chat
+from model.chat import Chat, StaleVersionError
 from model.chat_manager import ChatManager
 from model.message import Message
 
@@ -21,6 +25,10 @@ class TestChatModel(unittest.TestCase):
         history_file = self.chat_manager.get_chat_history_file(TEST_CHAT_NAME)
         if os.path.exists(history_file):
             os.remove(history_file)
+        shutil.rmtree(self.chat_manager.get_chat_blob_dir(TEST_CHAT_NAME), ignore_errors=True)
+        changes_file = self.chat_manager.get_chat_changes_file(TEST_CHAT_NAME)
+        if os.path.exists(changes_file):
+            os.remove(changes_file)
 
         self.chat_manager.create_chat(TEST_CHAT_NAME)
         self.chat = Chat(TEST_CHAT_NAME, self.chat_manager)
@@ -30,6 +38,10 @@ class TestChatModel(unittest.TestCase):
         history_file = self.chat_manager.get_chat_history_file(TEST_CHAT_NAME)
         if os.path.exists(history_file):
             os.remove(history_file)
+        shutil.rmtree(self.chat_manager.get_chat_blob_dir(TEST_CHAT_NAME), ignore_errors=True)
+        changes_file = self.chat_manager.get_chat_changes_file(TEST_CHAT_NAME)
+        if os.path.exists(changes_file):
+            os.remove(changes_file)
 
     def test_add_and_get_participant(self):
         """Test adding participants to the chat."""
@@ -119,5 +131,301 @@ class TestChatModel(unittest.TestCase):
         self.assertEqual(len(new_chat.get_messages()), 1)
         self.assertEqual(new_chat.get_messages()[0].content, "This is a test.")
 
+    def test_chat_picks_up_external_writes(self):
+        """Test that a chat re-reads its file after another writer changed it."""
+        owner = Chat(TEST_CHAT_NAME, self.chat_manager)
+        owner.add_participant("Alice")
+        owner.add_message("Alice", "from server")
+
+        # A write from another instance (e.g. the GUI) is picked up by the owner...
+        self.chat.add_message("Alice", "from gui")
+        self.assertEqual([m.content for m in owner.get_messages()], ["from server", "from gui"])
+
+        # ...and survives the owner's next write.
+        owner.add_message("Alice", "from server again")
+        contents = [m.content for m in Chat(TEST_CHAT_NAME, self.chat_manager).get_messages()]
+        self.assertEqual(contents, ["from server", "from gui", "from server again"])
+
+    def test_chat_skips_unchanged_reload(self):
+        """Test that a chat does not reload a file nobody else changed."""
+        owner = Chat(TEST_CHAT_NAME, self.chat_manager)
+        owner.add_participant("Alice")
+        messages = owner.get_messages()
+        owner.get_participants()
+        self.assertIs(owner.get_messages(), messages)
+
+    def test_change_feed_records_operations(self):
+        """Test that inserts, edits and deletes are recorded in order."""
+        self.chat.add_participant("Alice")
+        first = self.chat.add_message("Alice", "First")
+        second = self.chat.add_message("Alice", "Second")
+        self.chat.edit_message(first.id, "First, edited")
+        self.chat.delete_message(second.id)
+
+        feed = Chat(TEST_CHAT_NAME, self.chat_manager).get_changes()
+        self.assertEqual(feed["last_seq"], 4)
+        self.assertFalse(feed["reset"])
+        self.assertEqual(
+            [(c["seq"], c["op"], c["message_id"]) for c in feed["changes"]],
+            [(1, "insert", first.id), (2, "insert", second.id), (3, "edit", first.id), (4, "delete", second.id)]
+        )
+        self.assertEqual(feed["changes"][2]["value"], "First, edited")
+        self.assertIsNone(feed["changes"][3]["value"])
+
+    def test_change_feed_since_seq(self):
+        """Test that only changes after the given sequence number are returned."""
+        self.chat.add_participant("Alice")
+        message = self.chat.add_message("Alice", "First")
+        self.chat.edit_message(message.id, "Edited")
+
+        feed = self.chat.get_changes(since_seq=1)
+        self.assertEqual([c["seq"] for c in feed["changes"]], [2])
+        self.assertEqual(self.chat.get_changes(since_seq=2)["changes"], [])
+
+    def test_change_feed_client_ahead_must_reset(self):
+        """Test that a cursor beyond the chat's last sequence number asks for a reload."""
+        self.chat.add_participant("Alice")
+        self.chat.add_message("Alice", "First")
+        feed = self.chat.get_changes(since_seq=5)
+        self.assertTrue(feed["reset"])
+        self.assertEqual(feed["last_seq"], 1)
+
+    def test_change_feed_tolerates_duplicate_seqs(self):
+        """Test that entries with repeated sequence numbers are not returned twice."""
+        self.chat.add_participant("Alice")
+        message = self.chat.add_message("Alice", "First")
+        self.chat.edit_message(message.id, "Second")
+        # Two writers that loaded the same last_seq both appended seq 2.
+        self.chat.change_log.append({"seq": 2, "op": "edit", "message_id": message.id,
+                                     "value": "Racing", "timestamp": datetime.now().isoformat()})
+        self.chat.edit_message(message.id, "Third")
+
+        self.assertEqual([c["seq"] for c in self.chat.get_changes(since_seq=1)["changes"]], [2, 2, 3])
+        self.assertEqual(self.chat.get_changes(since_seq=3)["changes"], [])
+
+    def _age_change_log(self, chat, age):
+        """Backdates every entry of the chat's change log by the given age."""
+        with open(chat.changes_file) as f:
+            changes = [json.loads(line) for line in f]
+        for change in changes:
+            change["timestamp"] = (datetime.fromisoformat(change["timestamp"]) - age).isoformat()
+        # Replaced rather than rewritten in place, as every writer of the log does.
+        with open(chat.changes_file + ".tmp", "w") as f:
+            f.writelines(json.dumps(change) + "\n" for change in changes)
+        os.replace(chat.changes_file + ".tmp", chat.changes_file)
+
+    def test_change_feed_retention(self):
+        """Test that expired changes are truncated and stale clients must reset."""
+        chat = Chat(TEST_CHAT_NAME, self.chat_manager)
+        chat.add_participant("Alice")
+        message = chat.add_message("Alice", "Old")
+        self._age_change_log(chat, Chat.CHANGE_RETENTION + timedelta(hours=1))
+        chat.edit_message(message.id, "New")
+
+        feed = chat.get_changes(since_seq=0)
+        self.assertTrue(feed["reset"])
+        self.assertEqual([c["seq"] for c in feed["changes"]], [2])
+        self.assertFalse(chat.get_changes(since_seq=1)["reset"])
+
+    def test_change_log_kept_out_of_history_file(self):
+        """Test that the change log has its own file and is compacted once well expired."""
+        self.chat.add_participant("Alice")
+        message = self.chat.add_message("Alice", "Old")
+        with open(self.chat.history_file) as f:
+            self.assertNotIn("changes", json.load(f))
+
+        self._age_change_log(self.chat, Chat.CHANGE_RETENTION + Chat.CHANGE_COMPACTION_SLACK + timedelta(hours=1))
+        self.chat.edit_message(message.id, "New")
+        with open(self.chat.changes_file) as f:
+            self.assertEqual([json.loads(line)["seq"] for line in f], [2])
+
+    def test_edit_increments_version(self):
+        """Test that every edit bumps the message version."""
+        self.chat.add_participant("Alice")
+        message = self.chat.add_message("Alice", "v1")
+        self.assertEqual(message.version, 1)
+        self.chat.edit_message(message.id, "v2", expected_version=1)
+        self.assertEqual(Chat(TEST_CHAT_NAME, self.chat_manager).get_message_by_id(message.id).version, 2)
+
+    def test_stale_edit_and_delete_rejected(self):
+        """Test that edits and deletes against an outdated version fail."""
+        self.chat.add_participant("Alice")
+        message = self.chat.add_message("Alice", "Original")
+        self.chat.edit_message(message.id, "Changed by someone else")
+
+        with self.assertRaises(StaleVersionError):
+            self.chat.edit_message(message.id, "My edit", expected_version=1)
+        with self.assertRaises(StaleVersionError):
+            self.chat.delete_message(message.id, expected_version=1)
+        self.assertEqual(self.chat.get_message_by_id(message.id).content, "Changed by someone else")
+
+    def test_deleted_ids_not_reused(self):
+        """Test that a message added after deleting the newest one gets a fresh ID."""
+        self.chat.add_participant("Alice")
+        self.chat.add_message("Alice", "First")
+        deleted = self.chat.add_message("Alice", "Second")
+        self.chat.delete_message(deleted.id, expected_version=1)
+
+        replacement = Chat(TEST_CHAT_NAME, self.chat_manager).add_message("Alice", "Unrelated")
+        self.assertEqual(replacement.id, deleted.id + 1)
+        # A delete approved for the old message must not hit the new one.
+        with self.assertRaises(ValueError):
+            self.chat.delete_message(deleted.id, expected_version=1)
+        self.assertEqual([m.content for m in self.chat.get_messages()], ["First", "Unrelated"])
+
+    def test_insert_keeps_index_consistent(self):
+        """Test that lookups by ID still work after inserts and deletes."""
+        self.chat.add_participant("Alice")
+        first = self.chat.add_message("Alice", "First")
+        last = self.chat.add_message("Alice", "Last")
+        middle = self.chat.insert_message("Alice", "Middle", after_id=first.id)
+        self.chat.delete_message(first.id)
+        self.assertEqual([m.content for m in self.chat.get_messages()], ["Middle", "Last"])
+        self.assertEqual(self.chat.get_message_by_id(last.id).content, "Last")
+        self.assertEqual(self.chat.get_message_by_id(middle.id).content, "Middle")
+        self.assertIsNone(self.chat.get_message_by_id(first.id))
+
+    def test_large_message_stored_out_of_line(self):
+        """Test that large bodies go to the blob store and load lazily."""
+        self.chat.add_participant("Alice")
+        body = "x" * (Chat.BLOB_THRESHOLD + 1)
+        message = self.chat.add_message("Alice", body)
+
+        with open(self.chat.history_file) as f:
+            self.assertNotIn(body, f.read())
+
+        reloaded = Chat(TEST_CHAT_NAME, self.chat_manager).get_message_by_id(message.id)
+        self.assertFalse(reloaded.is_content_loaded)
+        self.assertEqual(reloaded.get_preview(10), "x" * 10)
+        self.assertFalse(reloaded.is_content_loaded)
+        self.assertEqual(reloaded, message)
+        repr(reloaded)
+        self.assertFalse(reloaded.is_content_loaded)
+        self.assertEqual(reloaded.content, body)
+
+    def test_stored_bodies_not_kept_in_memory(self):
+        """Test that a chat does not hold or pickle bodies it moved to the blob store."""
+        chat = Chat(TEST_CHAT_NAME, self.chat_manager)
+        chat.add_participant("Alice")
+        body = "x" * (Chat.BLOB_THRESHOLD * 4)
+        message = chat.add_message("Alice", body)
+
+        self.assertFalse(message.is_content_loaded)
+        self.assertLess(len(pickle.dumps(chat.get_messages())), Chat.BLOB_THRESHOLD)
+        # Bodies loaded later are not pickled either.
+        self.assertEqual(message.content, body)
+        restored = pickle.loads(pickle.dumps(chat.get_last_messages(1)))[0]
+        self.assertFalse(restored.is_content_loaded)
+        self.assertEqual(restored.content, body)
+
+    def test_blobs_deduplicated(self):
+        """Test that identical large bodies are stored only once."""
+        self.chat.add_participant("Alice")
+        body = "y" * (Chat.BLOB_THRESHOLD + 1)
+        first = self.chat.add_message("Alice", body)
+        second = self.chat.add_message("Alice", body)
+        self.assertEqual(first.blob_ref, second.blob_ref)
+        self.assertEqual(len(os.listdir(self.chat_manager.get_chat_blob_dir(TEST_CHAT_NAME))), 1)
+
+    def test_untouched_blob_survives_save(self):
+        """Test that saving does not need to load out-of-line bodies."""
+        self.chat.add_participant("Alice")
+        body = "z" * (Chat.BLOB_THRESHOLD + 1)
+        message = self.chat.add_message("Alice", body)
+        self.chat.add_message("Alice", "small")
+        self.assertFalse(self.chat.get_messages()[0].is_content_loaded)
+        blob_ref = message.blob_ref
+        self.chat.edit_message(message.id, "now small")
+        self.assertEqual(Chat(TEST_CHAT_NAME, self.chat_manager).get_message_by_id(message.id).content, "now small")
+        self.assertEqual(self.chat.get_changes(since_seq=0)["changes"][0]["value"]["content_ref"], blob_ref)
+
+    def test_unreferenced_blobs_collected(self):
+        """Test that blobs no message or retained change uses are deleted on compaction."""
+        self.chat.add_participant("Alice")
+        replaced = self.chat.add_message("Alice", "a" * (Chat.BLOB_THRESHOLD + 1))
+        kept = self.chat.add_message("Alice", "b" * (Chat.BLOB_THRESHOLD + 1))
+        self.chat.edit_message(replaced.id, "now small")
+
+        age = Chat.CHANGE_RETENTION + Chat.CHANGE_COMPACTION_SLACK + timedelta(hours=1)
+        self._age_change_log(self.chat, age)
+        old = (datetime.now() - age).timestamp()
+        blob_dir = self.chat_manager.get_chat_blob_dir(TEST_CHAT_NAME)
+        for digest in os.listdir(blob_dir):
+            os.utime(os.path.join(blob_dir, digest), (old, old))
+
+        self.chat.add_message("Alice", "triggers compaction")
+        self.assertEqual(os.listdir(blob_dir), [kept.blob_ref])
+        self.assertEqual(Chat(TEST_CHAT_NAME, self.chat_manager).get_message_by_id(kept.id).content[0], "b")
+
+    def test_context_window_fits_budget(self):
+        """Test that the context window keeps the newest messages within budget."""
+        self.chat.add_participant("Alice")
+        messages = [self.chat.add_message("Alice", "x" * 40) for _ in range(5)]
+        per_message = messages[0].tokens
+
+        window = Chat(TEST_CHAT_NAME, self.chat_manager).get_context(per_message * 2 + 1)
+        self.assertEqual([m.id for m in window], [m.id for m in messages[-2:]])
+        self.assertEqual(len(self.chat.get_context(per_message * 5)), 5)
+        self.assertEqual(self.chat.get_context(per_message - 1), [])
+
+    def test_interrupted_save_keeps_previous_history(self):
+        """Test that a save failing halfway never leaves a partial history file."""
+        self.chat.add_participant("Alice")
+        self.chat.add_message("Alice", "First")
+
+        def partial_dump(data, f, **kwargs):
+            f.write('{"participants": [')
+            raise OSError("disk full")
+
+        with mock.patch("model.chat.json.dump", side_effect=partial_dump):
+            with self.assertRaises(OSError):
+                self.chat.add_message("Alice", "Second")
+
+        reloaded = Chat(TEST_CHAT_NAME, self.chat_manager)
+        self.assertEqual([m.content for m in reloaded.get_messages()], ["First"])
+        self.assertEqual((reloaded.next_id, reloaded.last_seq), (2, 1))
+        self.assertFalse([name for name in os.listdir(".") if name.endswith(".tmp")])
+
+    def test_get_last_messages(self):
+        """Test that only the requested number of newest messages is returned."""
+        self.chat.add_participant("Alice")
+        messages = [self.chat.add_message("Alice", str(i)) for i in range(3)]
+        self.assertEqual(self.chat.get_last_messages(2), messages[1:])
+        self.assertEqual(self.chat.get_last_messages(5), messages)
+        self.assertEqual(self.chat.get_last_messages(0), [])
+        self.assertEqual(self.chat.get_last_messages(None), messages)
+
+    def test_context_window_estimates_without_loading_blobs(self):
+        """Test that messages without stored estimates are sized lazily, without loading blobs."""
+        self.chat.add_participant("Alice")
+        large = self.chat.add_message("Alice", "x" * (Chat.BLOB_THRESHOLD + 1))
+        with open(self.chat.history_file) as f:
+            data = json.load(f)
+        for msg in data["messages"]:
+            del msg["tokens"]
+        with open(self.chat.history_file, "w") as f:
+            json.dump(data, f)
+
+        chat = Chat(TEST_CHAT_NAME, self.chat_manager)
+        self.assertIsNone(chat.messages[0].tokens)
+        window = chat.get_context(large.tokens)
+        self.assertEqual([m.id for m in window], [large.id])
+        self.assertEqual(window[0].tokens, large.tokens)
+        self.assertFalse(window[0].is_content_loaded)
+
+    def test_context_window_tracks_edits_and_inserts(self):
+        """Test that token totals follow edits, inserts and deletes."""
+        chat = Chat(TEST_CHAT_NAME, self.chat_manager)
+        chat.add_participant("Alice")
+        first = chat.add_message("Alice", "short")
+        last = chat.add_message("Alice", "short")
+        chat.edit_message(first.id, "y" * 400)
+        chat.insert_message("Alice", "short", after_id=first.id)
+        chat.delete_message(last.id)
+
+        budget = sum(m.tokens for m in chat.get_messages())
+        self.assertEqual(len(chat.get_context(budget)), 2)
+        self.assertEqual(len(chat.get_context(budget - 1)), 1)
+
 if __name__ == "__main__":
     unittest.main()
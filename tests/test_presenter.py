@@ -0,0 +1,90 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from unittest import mock
+
+# Add the project root to the Python path to allow importing from 'presenter'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from model.chat import Chat
+from model.chat_manager import ChatManager
+from presenter.presenter import Presenter
+
+class TestPresenter(unittest.TestCase):
+
+    def setUp(self):
+        """Run each test in a scratch history directory."""
+        self.original_dir = os.getcwd()
+        self.history_dir = tempfile.mkdtemp()
+        os.chdir(self.history_dir)
+        self.presenter = Presenter()
+
+    def tearDown(self):
+        """Return to the original directory and remove the scratch one."""
+        os.chdir(self.original_dir)
+        shutil.rmtree(self.history_dir)
+
+    def test_default_chat_created_on_first_start(self):
+        """Test that an empty history directory gets a default chat."""
+        self.assertEqual(self.presenter.get_chat_list(), ["default"])
+        self.assertTrue(self.presenter.chat_manager.has_chats())
+
+    def test_chat_loaded_on_first_use(self):
+        """Test that neither startup nor switching chats loads a history."""
+        self._make_chat("alpha", 2)
+        presenter = Presenter()
+        self.assertIsNone(presenter.loaded_model)
+        presenter.switch_chat("alpha")
+        self.assertIsNone(presenter.loaded_model)
+        self.assertEqual(len(presenter.get_messages()), 2)
+        self.assertIsNotNone(presenter.loaded_model)
+
+    def _make_chat(self, chat_name: str, count: int):
+        self.presenter.create_chat(chat_name)
+        self.presenter.switch_chat(chat_name)
+        self.presenter.add_participant("Alice")
+        for i in range(count):
+            self.presenter.add_message("Alice", f"{chat_name} {i}")
+
+    def test_read_chats_batch(self):
+        """Test that a batch read returns each chat with its own cursor or limit."""
+        self._make_chat("alpha", 3)
+        self._make_chat("beta", 2)
+        self.presenter.switch_chat("default")
+
+        results = self.presenter.read_chats([
+            {"name": "alpha", "limit": 2},
+            {"name": "beta", "since_seq": 1},
+            {"name": "missing"},
+        ])
+        self.assertEqual([m.content for m in results[0]["messages"]], ["alpha 1", "alpha 2"])
+        self.assertEqual([c["seq"] for c in results[1]["changes"]["changes"]], [2])
+        self.assertIn("error", results[2])
+        # A batch read does not change the current chat.
+        self.assertEqual(self.presenter.chat_name, "default")
+
+    def test_context_reuses_loaded_chat(self):
+        """Test that repeated context reads of an unchanged chat reuse its token totals."""
+        self._make_chat("alpha", 3)
+        self.presenter.switch_chat("default")
+
+        with mock.patch.object(Chat, "_build_token_prefix", autospec=True,
+                               side_effect=Chat._build_token_prefix) as build:
+            self.presenter.get_context("alpha", 1000)
+            self.presenter.get_context("alpha", 1000)
+            self.assertEqual(build.call_count, 1)
+
+            # A write by another process (here a separate model) is picked up.
+            other = Chat("alpha", ChatManager())
+            other.add_message("Alice", "from elsewhere")
+            self.assertEqual(self.presenter.get_context("alpha", 1000)[-1].content, "from elsewhere")
+            self.assertEqual(build.call_count, 2)
+
+    def test_read_chats_empty(self):
+        """Test that an empty batch returns no results."""
+        self.assertEqual(self.presenter.read_chats([]), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from unittest import mock
+
+# Add the project root to the Python path to allow importing from 'mcp_server'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mcp_server.profiling import RequestProfiler
+from model import timing
+
+class TestRequestProfiler(unittest.TestCase):
+
+    def test_disabled_by_default(self):
+        """Test that nothing is recorded unless profiling is switched on."""
+        profiler = RequestProfiler()
+        self.assertIsNone(profiler.begin())
+        with timing.phase("load_data"):
+            pass
+        self.assertEqual(profiler.get_slow_log(), [])
+
+    def test_slow_log_records_phases(self):
+        """Test that slow requests are logged with their phase breakdown."""
+        profiler = RequestProfiler(slow_threshold_ms=0)
+        profile = profiler.begin()
+        with timing.phase("load_data"):
+            with timing.phase("load_json"):
+                pass
+        profiler.end(profile, "GET /chats/<string:chat_name>", "default", {"bytes": 10}, 200)
+
+        entry = profiler.get_slow_log()[0]
+        self.assertEqual(entry["route"], "GET /chats/<string:chat_name>")
+        self.assertEqual(entry["chat"], "default")
+        self.assertEqual(set(entry["phases_ms"]), {"load_data", "load_json"})
+
+    def test_fast_requests_not_logged(self):
+        """Test that requests under the threshold are not logged."""
+        profiler = RequestProfiler(slow_threshold_ms=60000)
+        profiler.end(profiler.begin(), "GET /", None, None, 200)
+        self.assertEqual(profiler.get_slow_log(), [])
+
+    def test_sampled_requests_aggregated(self):
+        """Test that sampled requests are merged into one cProfile report."""
+        profiler = RequestProfiler(sample_rate=1.0)
+        for _ in range(2):
+            profile = profiler.begin()
+            sorted(range(1000))
+            profiler.end(profile, "GET /", None, None, 200)
+        self.assertEqual(profiler.get_config()["sampled_requests"], 2)
+        self.assertIn("function calls", profiler.format_stats())
+
+    def test_configure_validates_and_toggles(self):
+        """Test runtime reconfiguration."""
+        profiler = RequestProfiler(slow_threshold_ms=100)
+        with self.assertRaises(ValueError):
+            profiler.configure(sample_rate=2)
+        profiler.configure(disable_slow_log=True)
+        self.assertIsNone(profiler.slow_threshold_ms)
+
+class TestServerProfilingHooks(unittest.TestCase):
+
+    def setUp(self):
+        """Import the server in a scratch history directory, as in debug mode."""
+        self.original_dir = os.getcwd()
+        self.history_dir = tempfile.mkdtemp()
+        os.chdir(self.history_dir)
+        from mcp_server import server
+        self.server = server
+        server.app.config["PROPAGATE_EXCEPTIONS"] = True
+        server.profiler.configure(sample_rate=1.0, slow_threshold_ms=0)
+
+    def tearDown(self):
+        """Restore the server's profiler and leave the scratch directory."""
+        self.server.profiler.configure(sample_rate=0.0, disable_slow_log=True)
+        self.server.profiler.reset()
+        os.chdir(self.original_dir)
+        shutil.rmtree(self.history_dir)
+
+    def test_failed_request_is_finished(self):
+        """Test that a request that raises still stops profiling and is logged as a 500."""
+        client = self.server.app.test_client()
+        with mock.patch.object(self.server.presenter, "get_chat_list", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                client.get("/chats")
+
+        entry = self.server.profiler.get_slow_log()[0]
+        self.assertEqual((entry["route"], entry["status"]), ("GET /chats", 500))
+        self.assertEqual(self.server.profiler.sampled_requests, 1)
+        self.assertIsNone(timing.stop_recording())
+
+        client.get("/chats")
+        self.assertEqual(self.server.profiler.get_slow_log()[1]["status"], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
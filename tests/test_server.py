@@ -0,0 +1,142 @@
+import json
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+# Add the project root to the Python path to allow importing from 'mcp_server'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mcp_server import server
+from mcp_server.confirmations import ConfirmationCache
+from presenter.presenter import Presenter
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        """Serve a fresh presenter over a scratch history directory."""
+        self.original_dir = os.getcwd()
+        self.history_dir = tempfile.mkdtemp()
+        os.chdir(self.history_dir)
+        self.original_state = (server.presenter, server.confirmations)
+        server.presenter = Presenter()
+        server.confirmations = ConfirmationCache()
+        self.client = server.app.test_client()
+        self.client.post("/participants", json={"name": "Alice"})
+
+    def tearDown(self):
+        """Restore the server's state and remove the scratch directory."""
+        server.presenter, server.confirmations = self.original_state
+        os.chdir(self.original_dir)
+        shutil.rmtree(self.history_dir)
+
+    def test_view_chat_preview_validated(self):
+        """Test that a negative or non-numeric preview length is rejected."""
+        self.client.post("/messages", json={"name": "Alice", "message": "hi"})
+        for preview in ("-5", "abc"):
+            response = self.client.get(f"/chats/default?preview={preview}")
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get("/chats/default?preview=1")
+        self.assertEqual(response.get_json()[0]["content"], "h")
+
+    def test_read_chats_validates_body(self):
+        """Test that malformed batch reads are rejected with a 400."""
+        bad_bodies = [
+            [1],
+            {"chats": "default"},
+            {"chats": [1]},
+            {"chats": [{"limit": 1}]},
+            {"chats": [{"name": "default", "limit": True}]},
+            {"chats": [{"name": "default", "since_seq": False}]},
+            {"chats": [{"name": "default", "preview": -1}]},
+            {"chats": [{"name": "default", "limit": "2"}]},
+            {"chats": [{"name": "default", "since_seq": 0, "limit": 1}]},
+            {"chats": [{"name": "default"}] * (server.MAX_BATCH_CHATS + 1)},
+        ]
+        for body in bad_bodies:
+            response = self.client.post("/chats/batch", json=body)
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_read_chats_reports_errors_inline(self):
+        """Test that a missing or malformed chat does not fail the whole batch."""
+        self.client.post("/messages", json={"name": "Alice", "message": "hi"})
+        self.client.post("/chats", json={"name": "broken"})
+        with open("chat_history_broken.json", "w") as f:
+            json.dump({"participants": [], "messages": [{"id": 1}]}, f)
+
+        response = self.client.post("/chats/batch", json={"chats": [
+            {"name": "default", "limit": 1},
+            {"name": "broken"},
+            {"name": "missing"},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        default, broken, missing = response.get_json()
+        self.assertEqual(default["messages"][0]["content"], "hi")
+        self.assertIn("could not be read", broken["error"])
+        self.assertIn("not found", missing["error"])
+
+    def _request_confirmation(self, method, message_id=1, new_content="edited"):
+        """Asks for a confirmation token for an edit or delete."""
+        body = {"new_content": new_content} if method == "PUT" else None
+        response = self.client.open(f"/messages/{message_id}", method=method, json=body)
+        return response.get_json()["confirmation_token"]
+
+    def _confirm(self, method, token, message_id=1, new_content="edited"):
+        body = {"new_content": new_content} if method == "PUT" else None
+        query = "?confirm=true" + (f"&token={token}" if token else "")
+        return self.client.open(f"/messages/{message_id}{query}", method=method, json=body)
+
+    def test_confirmed_edit_and_delete(self):
+        """Test that a confirmation token applies the edit or delete it was issued for."""
+        self.client.post("/messages", json={"name": "Alice", "message": "hi"})
+        response = self._confirm("PUT", self._request_confirmation("PUT"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.presenter.get_message_by_id(1).content, "edited")
+
+        response = self._confirm("DELETE", self._request_confirmation("DELETE"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(server.presenter.get_message_by_id(1))
+
+    def test_confirmation_token_rejected(self):
+        """Test that missing, unknown, reused and mismatched tokens are rejected."""
+        self.client.post("/messages", json={"name": "Alice", "message": "hi"})
+        self.assertEqual(self._confirm("DELETE", None).status_code, 400)
+        self.assertEqual(self._confirm("DELETE", "not-a-token").status_code, 400)
+
+        token = self._request_confirmation("DELETE")
+        self.assertEqual(self._confirm("PUT", token).status_code, 400)
+        # The failed attempt used the token up.
+        self.assertEqual(self._confirm("DELETE", token).status_code, 400)
+
+        token = self._request_confirmation("PUT", new_content="approved")
+        self.assertEqual(self._confirm("PUT", token, new_content="something else").status_code, 400)
+        self.assertEqual(server.presenter.get_message_by_id(1).content, "hi")
+
+    def test_expired_confirmation_token_rejected(self):
+        """Test that a token cannot be redeemed after its TTL."""
+        server.confirmations = ConfirmationCache(ttl=0)
+        self.client.post("/messages", json={"name": "Alice", "message": "hi"})
+        token = self._request_confirmation("DELETE")
+        self.assertEqual(self._confirm("DELETE", token).status_code, 400)
+        self.assertIsNotNone(server.presenter.get_message_by_id(1))
+
+    def test_confirmation_token_from_other_chat(self):
+        """Test that a token issued in one chat conflicts after switching chats."""
+        self.client.post("/messages", json={"name": "Alice", "message": "hi"})
+        token = self._request_confirmation("DELETE")
+        self.client.post("/chats", json={"name": "other"})
+        self.client.get("/chats/other")
+        self.assertEqual(self._confirm("DELETE", token).status_code, 409)
+        self.assertIsNotNone(server.presenter.get_message_by_id(1, chat_name="default"))
+
+    def test_stale_confirmation_conflicts(self):
+        """Test that a confirmed action fails if the message changed since it was shown."""
+        self.client.post("/messages", json={"name": "Alice", "message": "hi"})
+        token = self._request_confirmation("DELETE")
+        server.presenter.edit_message(1, "changed meanwhile")
+        self.assertEqual(self._confirm("DELETE", token).status_code, 409)
+        self.assertEqual(server.presenter.get_message_by_id(1).content, "changed meanwhile")
+
+if __name__ == "__main__":
+    unittest.main()
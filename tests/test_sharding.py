@@ -0,0 +1,92 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+# Add the project root to the Python path to allow importing from 'mcp_server'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mcp_server.sharding import HashRing, ShardedPresenter
+
+class TestHashRing(unittest.TestCase):
+
+    def test_assignment_is_stable(self):
+        """Test that a chat always maps to the same worker."""
+        ring = HashRing(4)
+        self.assertEqual(ring.get_node("general"), HashRing(4).get_node("general"))
+
+    def test_all_nodes_used(self):
+        """Test that chats are spread across all workers."""
+        ring = HashRing(4)
+        nodes = {ring.get_node(f"chat-{i}") for i in range(200)}
+        self.assertEqual(nodes, {0, 1, 2, 3})
+
+    def test_adding_node_moves_few_keys(self):
+        """Test that growing the ring only reassigns a fraction of the chats."""
+        before, after = HashRing(4), HashRing(5)
+        moved = sum(before.get_node(f"chat-{i}") != after.get_node(f"chat-{i}") for i in range(1000))
+        self.assertLess(moved, 400)
+
+class TestShardedPresenter(unittest.TestCase):
+
+    def setUp(self):
+        """Start a sharded presenter over a scratch history directory."""
+        self.history_dir = tempfile.mkdtemp()
+        self.presenter = ShardedPresenter(2, history_dir=self.history_dir)
+
+    def tearDown(self):
+        """Stop the workers and remove the scratch directory."""
+        self.presenter.close()
+        shutil.rmtree(self.history_dir)
+
+    def test_default_chat_created(self):
+        """Test that the default chat is created on first start."""
+        self.assertEqual(self.presenter.get_chat_list(), ["default"])
+
+    def test_messages_routed_per_chat(self):
+        """Test that each chat keeps its own state on its owning worker."""
+        for chat_name in ("alpha", "beta", "gamma"):
+            self.presenter.create_chat(chat_name)
+            self.presenter.switch_chat(chat_name)
+            self.presenter.add_participant("Alice")
+            self.presenter.add_message("Alice", f"Hello {chat_name}")
+
+        for chat_name in ("alpha", "beta", "gamma"):
+            self.presenter.switch_chat(chat_name)
+            messages = self.presenter.get_messages()
+            self.assertEqual([msg.content for msg in messages], [f"Hello {chat_name}"])
+            self.assertEqual(self.presenter.get_chat(chat_name)["participants"], ["Alice"])
+
+    def test_read_chats_across_workers(self):
+        """Test that a batch read collects chats from all owning workers."""
+        names = [f"chat-{i}" for i in range(6)]
+        for chat_name in names:
+            self.presenter.create_chat(chat_name)
+            self.presenter.switch_chat(chat_name)
+            self.presenter.add_participant("Alice")
+            self.presenter.add_message("Alice", chat_name)
+
+        results = self.presenter.read_chats([{"name": name, "limit": 1} for name in names])
+        self.assertEqual([r["messages"][0].content for r in results], names)
+
+    def test_explicit_chat_name_ignores_current_chat(self):
+        """Test that calls naming a chat are not redirected by a switch."""
+        for chat_name in ("alpha", "beta"):
+            self.presenter.create_chat(chat_name)
+            self.presenter.add_participant("Alice", chat_name=chat_name)
+        self.presenter.switch_chat("beta")
+        self.presenter.add_message("Alice", "For alpha", chat_name="alpha")
+
+        self.assertEqual([m.content for m in self.presenter.get_messages(chat_name="alpha")], ["For alpha"])
+        self.assertEqual(self.presenter.get_messages(), [])
+
+    def test_worker_errors_propagate(self):
+        """Test that model errors raised in a worker reach the caller."""
+        with self.assertRaises(ValueError):
+            self.presenter.add_message("Eve", "Sneaky message")
+        with self.assertRaises(ValueError):
+            self.presenter.create_chat("default")
+
+if __name__ == "__main__":
+    unittest.main()
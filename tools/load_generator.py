@@ -0,0 +1,373 @@
+"""
+End-to-end load generator for the chat application.
+
+Starts an MCP server against a scratch history directory (or targets one
+that is already running), then runs simulated agents that use the HTTP API
+and simulated GUI writers that use the Presenter directly, all against the
+same chat. At the end it reports throughput, latency percentiles and a
+consistency check of the resulting history file.
+
+Example:
+    python3 tools/load_generator.py --agents 4 --gui-writers 2 --ops 200
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from model.chat import Chat
+from model.chat_manager import ChatManager
+
+SERVER_SCRIPT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'mcp_server', 'server.py'))
+CHAT_NAME = "loadtest"
+OPERATIONS = ("read", "append", "insert", "edit", "delete")
+DEFAULT_MIX = "read=40,append=30,insert=10,edit=10,delete=10"
+# Every message written by the tool starts with its unique tag, e.g. "[agent-0-12]".
+TAG_PATTERN = re.compile(r"^\[([^\]]+)\]")
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    """Parses an operation mix such as 'read=50,append=50' into weights."""
+    weights = {}
+    for part in mix.split(","):
+        op, _, weight = part.partition("=")
+        op = op.strip()
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{op}'. Expected one of: {', '.join(OPERATIONS)}.")
+        weights[op] = int(weight)
+    if not any(weights.values()):
+        raise ValueError("The operation mix must have at least one non-zero weight.")
+    return weights
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Returns the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class _HttpClient:
+    """Minimal JSON client for the MCP server API."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    def call(self, method: str, path: str, body: Optional[dict] = None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        req = urllib.request.Request(
+            self.base_url + path, data=data, method=method,
+            headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(req) as resp:
+                return json.load(resp)
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode("utf-8", "replace")
+            try:
+                detail = json.loads(detail).get("error", detail)
+            except (ValueError, AttributeError):
+                pass
+            raise ValueError(f"{method} {path} -> {e.code}: {detail}")
+
+
+class _AgentSession:
+    """Performs operations the way an agent does, over HTTP."""
+
+    def __init__(self, base_url: str, name: str):
+        self.client = _HttpClient(base_url)
+        self.name = name
+
+    def read(self):
+        self.client.call("GET", f"/chats/{CHAT_NAME}")
+
+    def append(self, content: str) -> int:
+        return self.client.call("POST", "/messages", {"name": self.name, "message": content})["id"]
+
+    def insert(self, content: str, after_id: int) -> int:
+        body = {"name": self.name, "message": content, "after_id": after_id}
+        return self.client.call("POST", "/messages/insert", body)["id"]
+
+    def edit(self, message_id: int, content: str):
+        body = {"new_content": content}
+        token = self.client.call("PUT", f"/messages/{message_id}", body)["confirmation_token"]
+        self.client.call("PUT", f"/messages/{message_id}?confirm=true&token={token}", body)
+
+    def delete(self, message_id: int):
+        token = self.client.call("DELETE", f"/messages/{message_id}")["confirmation_token"]
+        self.client.call("DELETE", f"/messages/{message_id}?confirm=true&token={token}")
+
+
+class _GuiSession:
+    """Performs operations the way the GUI does, through a Presenter."""
+
+    def __init__(self, history_dir: str, name: str):
+        # The Presenter works on the current directory, like main.py does.
+        os.chdir(history_dir)
+        from presenter.presenter import Presenter
+        self.presenter = Presenter()
+        self.presenter.switch_chat(CHAT_NAME)
+        self.name = name
+
+    def read(self):
+        self.presenter.get_messages()
+
+    def append(self, content: str) -> int:
+        return self.presenter.add_message(self.name, content).id
+
+    def insert(self, content: str, after_id: int) -> int:
+        return self.presenter.insert_message(self.name, content, after_id).id
+
+    def edit(self, message_id: int, content: str):
+        self.presenter.edit_message(message_id, content)
+
+    def delete(self, message_id: int):
+        self.presenter.delete_message(message_id)
+
+
+def _run_client(kind: str, index: int, target: str, ops: int, weights: Dict[str, int],
+                seed: int, start_event, results):
+    """Client process: runs a random sequence of operations and reports back."""
+    name = f"{kind}-{index}"
+    session = _AgentSession(target, name) if kind == "agent" else _GuiSession(target, name)
+    rng = random.Random(seed)
+    choices, cum_weights = list(weights), []
+    for op in choices:
+        cum_weights.append((cum_weights[-1] if cum_weights else 0) + weights[op])
+
+    latencies: Dict[str, List[float]] = {op: [] for op in OPERATIONS}
+    errors: Dict[str, int] = {op: 0 for op in OPERATIONS}
+    error_samples: List[str] = []
+    written: Dict[str, int] = {}  # tag -> message ID, for acknowledged writes
+    edited, deleted = set(), set()
+    counter = 0
+
+    start_event.wait()
+    for _ in range(ops):
+        op = rng.choices(choices, cum_weights=cum_weights)[0]
+        live = [tag for tag in written if tag not in deleted]
+        if op in ("insert", "edit", "delete") and not live:
+            op = "append"
+        started = time.perf_counter()
+        try:
+            if op == "read":
+                session.read()
+            elif op in ("append", "insert"):
+                tag = f"{name}-{counter}"
+                counter += 1
+                content = f"[{tag}] {op} from {name}"
+                if op == "append":
+                    written[tag] = session.append(content)
+                else:
+                    written[tag] = session.insert(content, written[rng.choice(live)])
+            elif op == "edit":
+                tag = rng.choice(live)
+                session.edit(written[tag], f"[{tag}] edited by {name}")
+                edited.add(tag)
+            else:
+                tag = rng.choice(live)
+                session.delete(written[tag])
+                deleted.add(tag)
+            latencies[op].append(time.perf_counter() - started)
+        except Exception as e:
+            errors[op] += 1
+            if len(error_samples) < 5:
+                error_samples.append(f"{op}: {e}")
+
+    results.put({
+        "client": name,
+        "latencies": latencies,
+        "errors": errors,
+        "error_samples": error_samples,
+        "written": written,
+        "edited": sorted(edited - deleted),
+        "deleted": sorted(deleted),
+    })
+
+
+def check_consistency(history_dir: str, client_results: List[dict]) -> dict:
+    """
+    Compares the final history file with what clients were told succeeded.
+    Reports corrupted files, duplicate IDs, lost writes, lost edits and
+    deleted messages that came back.
+    """
+    chat_manager = ChatManager(history_dir)
+    try:
+        with open(chat_manager.get_chat_history_file(CHAT_NAME)) as f:
+            json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        return {"corrupted": True, "error": str(e)}
+
+    messages = Chat(CHAT_NAME, chat_manager).get_messages()
+    ids = [msg.id for msg in messages]
+    contents: Dict[str, str] = {}
+    for msg in messages:
+        match = TAG_PATTERN.match(msg.content)
+        if match:
+            contents[match.group(1)] = msg.content
+
+    lost_writes, lost_edits, resurrected = [], [], []
+    for result in client_results:
+        deleted = set(result["deleted"])
+        for tag in result["written"]:
+            if tag in deleted:
+                if tag in contents:
+                    resurrected.append(tag)
+            elif tag not in contents:
+                lost_writes.append(tag)
+        for tag in result["edited"]:
+            if tag in contents and " edited by " not in contents[tag]:
+                lost_edits.append(tag)
+
+    return {
+        "corrupted": False,
+        "messages": len(messages),
+        "duplicate_ids": sorted({i for i in ids if ids.count(i) > 1}),
+        "lost_writes": lost_writes,
+        "lost_edits": lost_edits,
+        "resurrected_deletes": resurrected,
+    }
+
+
+def _start_server(history_dir: str, port: int, workers: int) -> subprocess.Popen:
+    """Starts an MCP server in its own process group and waits until it answers."""
+    log_path = os.path.join(history_dir, "server.log")
+    # The server writes to its own copy of the descriptor, so ours can be closed.
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(
+            [sys.executable, SERVER_SCRIPT, "--port", str(port), "--workers", str(workers)],
+            cwd=history_dir, stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+        )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/")
+            return process
+        except (urllib.error.URLError, ConnectionError):
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    _stop_server(process)
+    raise RuntimeError(f"MCP server did not start; see {log_path}.")
+
+
+def _stop_server(process: subprocess.Popen):
+    # The debug server runs a reloader child, so the whole group is stopped.
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def _print_report(client_results: List[dict], elapsed: float, consistency: dict):
+    print(f"\n{'operation':<10}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    total = 0
+    for op in OPERATIONS:
+        values = sorted(v for r in client_results for v in r["latencies"][op])
+        errors = sum(r["errors"][op] for r in client_results)
+        if not values and not errors:
+            continue
+        total += len(values)
+        row = [percentile(values, p) * 1000 for p in (50, 95, 99, 100)]
+        print(f"{op:<10}{len(values):>8}{errors:>8}" + "".join(f"{v:>10.1f}" for v in row))
+    print(f"\n{total} successful operations in {elapsed:.2f}s ({total / elapsed:.1f} ops/s)")
+
+    samples = [s for r in client_results for s in r["error_samples"]]
+    if samples:
+        print("\nSample errors:")
+        for sample in samples[:10]:
+            print(f"  {sample}")
+
+    print("\nConsistency:")
+    if consistency["corrupted"]:
+        print(f"  history file is CORRUPTED: {consistency['error']}")
+        return
+    print(f"  messages in final history: {consistency['messages']}")
+    for key in ("duplicate_ids", "lost_writes", "lost_edits", "resurrected_deletes"):
+        values = consistency[key]
+        print(f"  {key.replace('_', ' ')}: {len(values)}" + (f" (e.g. {values[:5]})" if values else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local end-to-end load test.")
+    parser.add_argument("--agents", type=int, default=4, help="Simulated agent processes using the HTTP API.")
+    parser.add_argument("--gui-writers", type=int, default=1, help="Simulated GUI processes using the Presenter.")
+    parser.add_argument("--ops", type=int, default=100, help="Operations per client.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Operation weights (default: {DEFAULT_MIX}).")
+    parser.add_argument("--history-dir", help="History directory to use (default: a new temporary directory).")
+    parser.add_argument("--port", type=int, default=5055, help="Port for the server started by the tool.")
+    parser.add_argument("--server-workers", type=int, default=1, help="Value of --workers for the server.")
+    parser.add_argument("--server-url", help="Use an already running server instead of starting one. "
+                                             "It must serve --history-dir.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+
+    if args.server_url and not args.history_dir:
+        parser.error("--server-url requires --history-dir.")
+    weights = parse_mix(args.mix)
+    history_dir = os.path.abspath(args.history_dir or tempfile.mkdtemp(prefix="chat-load-"))
+    print(f"History directory: {history_dir}")
+
+    server = None if args.server_url else _start_server(history_dir, args.port, args.server_workers)
+    base_url = args.server_url or f"http://127.0.0.1:{args.port}"
+    try:
+        client = _HttpClient(base_url)
+        if CHAT_NAME not in client.call("GET", "/chats"):
+            client.call("POST", "/chats", {"name": CHAT_NAME})
+        client.call("GET", f"/chats/{CHAT_NAME}")
+        clients = [("agent", i) for i in range(args.agents)] + [("gui", i) for i in range(args.gui_writers)]
+        for kind, index in clients:
+            client.call("POST", "/participants", {"name": f"{kind}-{index}"})
+
+        start_event = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=_run_client,
+                args=(kind, index, base_url if kind == "agent" else history_dir, args.ops,
+                      weights, args.seed * 1000 + n, start_event, results)
+            )
+            for n, (kind, index) in enumerate(clients)
+        ]
+        for process in processes:
+            process.start()
+
+        started = time.perf_counter()
+        start_event.set()
+        # Drain the queue before joining so large results cannot block the children.
+        client_results = []
+        while len(client_results) < len(processes):
+            try:
+                client_results.append(results.get(timeout=1))
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    print(f"{len(processes) - len(client_results)} client(s) exited without reporting.")
+                    break
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+    finally:
+        if server is not None:
+            _stop_server(server)
+
+    _print_report(client_results, elapsed, check_consistency(history_dir, client_results))
+
+
+if __name__ == "__main__":
+    main()